@@ -1,53 +1,80 @@
 # Module for interacting with ChromaDB for vector storage and similarity search.
 import chromadb
+import functools
 import os
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Union
 import numpy as np
 
 # Configuration constants for ChromaDB.
 # COLLECTION_NAME = "car-manuals"  # Default, but we'll make it flexible
 PERSIST_DIRECTORY = "chroma_db"    # Directory where ChromaDB data will be persisted.
 DEFAULT_COLLECTION_NAME = "car-manuals" # Keep a default
+# Number of records sent per upsert. Large batches keep the number of HNSW index
+# updates and persistence round-trips low; capped by the client's max_batch_size.
+UPSERT_BATCH_SIZE = 5000
+# Distance metric for new collections. All stored and query vectors are unit length (OpenAI
+# embeddings are normalized by the API, image embeddings at encode time), so inner product
+# ranks exactly like cosine while skipping the per-comparison norm computation. Collections
+# created earlier keep their original "cosine" space; on unit vectors both give the same distances.
+DISTANCE_SPACE = "ip"
 
+def _normalize_rows(vectors) -> np.ndarray:
+    """Returns the vectors as a float32 array with every row scaled to unit L2 norm."""
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    return vectors
+
+@functools.lru_cache(maxsize=None)
 def get_client():
-    """Initializes and returns a persistent ChromaDB client."""
+    """Initializes and returns the persistent ChromaDB client, created once per process."""
     return chromadb.PersistentClient(path=PERSIST_DIRECTORY, settings=Settings())
 
+def _get_or_create_collection(client: chromadb.ClientAPI, collection_name: str):
+    return client.get_or_create_collection(
+        name=collection_name,
+        metadata={"hnsw:space": DISTANCE_SPACE}  # Specifies the distance metric for similarity search.
+    )
+
+@functools.lru_cache(maxsize=None)
+def _cached_collection(collection_name: str):
+    """Returns the collection handle for the shared client, resolved once per collection name."""
+    return _get_or_create_collection(get_client(), collection_name)
+
 def get_collection(collection_name: str, client: Optional[chromadb.ClientAPI] = None):
     """Initialize ChromaDB client with persistence and get or create the specified collection.
+    Collections of the shared client are cached, so hot paths don't re-open them on every call.
     
     Args:
         collection_name (str): The name of the collection to get or create.
-        client (Optional[chromadb.ClientAPI]): An existing client to use. If None, a new one is created.
+        client (Optional[chromadb.ClientAPI]): An existing client to use. If None, the shared client is used.
 
     Returns:
         chromadb.api.models.Collection.Collection: The ChromaDB collection object.
     """
     if client is None:
-        client = get_client()
-    
-    collection = client.get_or_create_collection(
-        name=collection_name,
-        metadata={"hnsw:space": "cosine"}  # Specifies the distance metric for similarity search.
-    )
-    return collection
+        return _cached_collection(collection_name)
+    return _get_or_create_collection(client, collection_name)
 
 # Modified store_embeddings to accept collection_name and pre-generated IDs
 def store_embeddings(texts: List[str], 
-                     embeddings: List[List[float]], 
+                     embeddings: Union[List[List[float]], np.ndarray], 
                      ids: List[str], 
                      collection_name: str, 
-                     metadata: List[Dict[str, Any]] = None):
+                     metadata: List[Dict[str, Any]] = None,
+                     batch_size: int = UPSERT_BATCH_SIZE):
     """Store text chunks, their embeddings, IDs, and metadata in a specified ChromaDB collection.
 
     Args:
         texts (List[str]): A list of text chunks to store.
-        embeddings (List[List[float]]): A list of embeddings corresponding to the text chunks.
+        embeddings (Union[List[List[float]], np.ndarray]): Embeddings corresponding to the text chunks, either
+                                                          as a list of vectors or a 2-D array (one row per chunk).
         ids (List[str]): A list of unique IDs for each document.
         collection_name (str): The name of the ChromaDB collection to use.
         metadata (List[Dict[str, Any]], optional): A list of metadata dictionaries for each text chunk.
                                                   Defaults to None, in which case basic metadata is generated.
+        batch_size (int, optional): Maximum number of records per upsert call. Defaults to UPSERT_BATCH_SIZE.
 
     Returns:
         dict: A dictionary containing the count of stored items and the collection name.
@@ -55,14 +82,21 @@ def store_embeddings(texts: List[str],
     if not (len(texts) == len(embeddings) == len(ids) == (len(metadata) if metadata else len(texts))):
         raise ValueError("texts, embeddings, ids, and metadata (if provided) must have the same number of elements.")
 
+    # Inner-product search assumes unit vectors, so every row is L2-normalized here in one
+    # vectorized pass. This Chroma version only accepts embeddings as Python lists, so the
+    # result is converted once here instead of every caller boxing each vector separately.
+    if len(embeddings):
+        embeddings = _normalize_rows(embeddings).tolist()
+
+    client = get_client()
     collection = get_collection(collection_name) # Get the specified collection.
     
     # If no metadata is provided, create a default metadata structure for each document.
     # This ensures metadata list aligns with other lists if it was None.
     processed_metadata = metadata if metadata is not None else [{"source": "unknown"} for _ in texts]
         
-    # Add documents to the collection in batches to handle potentially large datasets efficiently.
-    batch_size = 100
+    # Add documents to the collection in batches; Chroma rejects batches above the client's limit.
+    batch_size = min(batch_size, getattr(client, "max_batch_size", batch_size))
     for i in range(0, len(texts), batch_size):
         batch_end = min(i + batch_size, len(texts)) # Ensure the batch end does not exceed the list length.
         collection.upsert(
@@ -77,42 +111,67 @@ def store_embeddings(texts: List[str],
         "collection_name": collection_name
     }
 
+@dataclass
+class SearchResults:
+    """Results of a similarity search in columnar form, ordered from most to least similar."""
+    ids: List[str] = field(default_factory=list)
+    texts: List[str] = field(default_factory=list)
+    similarities: np.ndarray = field(default_factory=lambda: np.empty(0)) # float64, one per result
+    metadatas: List[Dict[str, Any]] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+def search_similar_columns(query_embedding: List[float], collection_name: str, top_k: int = 3,
+                           collection: Optional[Any] = None) -> SearchResults:
+    """Search for documents in a specified ChromaDB collection that are most similar to a given query embedding,
+    returning the results as columns (see search_similar for the arguments). Cheaper than search_similar
+    for large top_k, since no per-result dictionaries are built.
+    """
+    if collection is None:
+        collection = get_collection(collection_name) # Get the specified collection.
+    
+    # Query the collection for the most similar documents.
+    # 'include' specifies what information to return along with the documents.
+    results = collection.query(
+        query_embeddings=_normalize_rows(query_embedding).tolist(), # A one-row list of unit-length query vectors.
+        n_results=top_k,
+        include=["documents", "distances", "metadatas"] # Request documents, distances, and metadatas.
+    )
+    
+    if not results['documents'] or not results['documents'][0]: # Check if results are not empty.
+        return SearchResults()
+    # Distances are always returned alongside documents when requested in 'include';
+    # convert them all to similarities with a single vector operation.
+    return SearchResults(
+        ids=results['ids'][0],
+        texts=results['documents'][0],
+        similarities=1.0 - np.asarray(results['distances'][0], dtype=np.float64),
+        metadatas=results['metadatas'][0]
+    )
+
 # Modified search_similar to accept collection_name
-def search_similar(query_embedding: List[float], collection_name: str, top_k: int = 3) -> List[Dict[str, Any]]:
+def search_similar(query_embedding: List[float], collection_name: str, top_k: int = 3,
+                   collection: Optional[Any] = None) -> List[Dict[str, Any]]:
     """Search for documents in a specified ChromaDB collection that are most similar to a given query embedding.
 
     Args:
         query_embedding (List[float]): The embedding of the query string.
         collection_name (str): The name of the ChromaDB collection to search in.
         top_k (int, optional): The number of top similar documents to retrieve. Defaults to 3.
+        collection (optional): An already opened handle of the collection (e.g. resolved at server startup).
+                               If None, the handle is looked up by collection_name.
 
     Returns:
         List[Dict[str, Any]]: A list of dictionaries, where each dictionary represents a similar document
                               and includes its text, similarity score, and metadata.
     """
-    collection = get_collection(collection_name) # Get the specified collection.
-    
-    # Query the collection for the most similar documents.
-    # 'include' specifies what information to return along with the documents.
-    results = collection.query(
-        query_embeddings=[query_embedding], # The query embedding needs to be in a list.
-        n_results=top_k,
-        include=["documents", "distances", "metadatas"] # Request documents, distances, and metadatas.
-    )
-    
-    # Format the raw results from ChromaDB into a more usable list of dictionaries.
-    similar_chunks = []
-    if results['documents'] and results['documents'][0]: # Check if results are not empty.
-        for i in range(len(results['documents'][0])):
-            # Ensure distances are available before calculating similarity
-            similarity_score = 1 - results['distances'][0][i] if results.get('distances') and results['distances'][0] and i < len(results['distances'][0]) else None # Renamed for clarity
-            similar_chunks.append({
-                'text': results['documents'][0][i],
-                'similarity': similarity_score,
-                'metadata': results['metadatas'][0][i]
-            })
-    
-    return similar_chunks
+    results = search_similar_columns(query_embedding, collection_name, top_k, collection)
+    # Format the columns into a more usable list of dictionaries.
+    return [
+        {'text': text, 'similarity': float(similarity), 'metadata': metadata}
+        for text, similarity, metadata in zip(results.texts, results.similarities, results.metadatas)
+    ]
 
 # Keep the old init_chroma for now if other parts of the code still use it with the default name,
 # but ideally, they should be updated to use get_collection.
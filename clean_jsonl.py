@@ -1,55 +1,89 @@
 import json
+import os
 import sys
 
+# orjson parses and serializes several times faster than the stdlib json module;
+# fall back to json when it is not installed. Both variants work on bytes.
+try:
+    import orjson
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
 input_file = "fine_tuning_data.jsonl"
 output_file_messages = "fine_tuning_clean_messages.jsonl"
 output_file_prompt = "fine_tuning_clean_prompt.jsonl"
 
-valid_lines_messages = []
-valid_lines_prompt = []
+def count_lines(path):
+    """Counts the lines of a file, reading it in large binary blocks without parsing anything."""
+    with open(path, 'rb') as f:
+        return sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b''))
+
+num_lines_messages = 0
+num_lines_prompt = 0
 errors = []
 
-# Process each line
-with open(input_file, 'r') as f:
-    for i, line in enumerate(f, 1):
+# Process each line in a single pass, writing both output formats as we go. The outputs are written
+# to temporary files and only moved into place if they received any lines.
+tmp_file_messages = output_file_messages + '.tmp'
+tmp_file_prompt = output_file_prompt + '.tmp'
+with open(input_file, 'rb') as fin, \
+        open(tmp_file_messages, 'wb') as f_messages, \
+        open(tmp_file_prompt, 'wb') as f_prompt:
+    for i, line in enumerate(fin, 1):
         line = line.strip()
         if not line:  # Skip empty lines
             continue
-            
+
         try:
             # Parse JSON
-            obj = json.loads(line)
-            
-            # Save messages format
-            valid_lines_messages.append(json.dumps(obj))
-            
-            # Transform to prompt/completion format
-            if 'messages' in obj:
-                user_message = next((msg for msg in obj['messages'] if msg['role'] == 'user'), None)
-                assistant_message = next((msg for msg in obj['messages'] if msg['role'] == 'assistant'), None)
-                
-                if user_message and assistant_message:
-                    prompt_completion = {
-                        "prompt": user_message['content'],
-                        "completion": assistant_message['content']
-                    }
-                    valid_lines_prompt.append(json.dumps(prompt_completion))
-        except json.JSONDecodeError as e:
-            errors.append(f"Error on line {i}: {str(e)[:100]} - line content: {line[:50]}...")
+            obj = loads(line)
+        except json.JSONDecodeError as e: # orjson.JSONDecodeError subclasses json.JSONDecodeError
+            errors.append(f"Error on line {i}: {str(e)[:100]} - line content: {line[:50].decode('utf-8', 'replace')}...")
+            continue
+
+        # Save messages format
+        f_messages.write(dumps(obj) + b'\n')
+        num_lines_messages += 1
+
+        # Transform to prompt/completion format
+        if 'messages' in obj:
+            # Find the first user and first assistant message in a single scan
+            user_message = assistant_message = None
+            for msg in obj['messages']:
+                role = msg['role']
+                if role == 'user' and user_message is None:
+                    user_message = msg
+                elif role == 'assistant' and assistant_message is None:
+                    assistant_message = msg
+                if user_message is not None and assistant_message is not None:
+                    break
 
-# Write messages format to file
-if valid_lines_messages:
-    with open(output_file_messages, 'w') as f:
-        for line in valid_lines_messages:
-            f.write(line + '\n')
-    print(f"Wrote {len(valid_lines_messages)} valid lines to {output_file_messages}")
+            if user_message and assistant_message:
+                prompt_completion = {
+                    "prompt": user_message['content'],
+                    "completion": assistant_message['content']
+                }
+                f_prompt.write(dumps(prompt_completion) + b'\n')
+                num_lines_prompt += 1
 
-# Write prompt/completion format to file
-if valid_lines_prompt:
-    with open(output_file_prompt, 'w') as f:
-        for line in valid_lines_prompt:
-            f.write(line + '\n')
-    print(f"Wrote {len(valid_lines_prompt)} valid lines to {output_file_prompt}")
+# Write each output only if it has lines, as before
+for tmp_file, output_file, num_lines in ((tmp_file_messages, output_file_messages, num_lines_messages),
+                                         (tmp_file_prompt, output_file_prompt, num_lines_prompt)):
+    if num_lines:
+        os.replace(tmp_file, output_file)
+        print(f"Wrote {num_lines} valid lines to {output_file}")
+    else:
+        os.remove(tmp_file)
 
 # Report errors
 if errors:
@@ -59,19 +93,13 @@ if errors:
 else:
     print("No errors found.")
 
-# Verify the output files
-try:
-    with open(output_file_messages, 'r') as f:
-        for i, line in enumerate(f, 1):
-            json.loads(line)
-    print(f"Verification successful: {output_file_messages} contains valid JSON on each line.")
-except json.JSONDecodeError as e:
-    print(f"Verification failed for {output_file_messages}: {str(e)}")
-
-try:
-    with open(output_file_prompt, 'r') as f:
-        for i, line in enumerate(f, 1):
-            json.loads(line)
-    print(f"Verification successful: {output_file_prompt} contains valid JSON on each line.")
-except json.JSONDecodeError as e:
-    print(f"Verification failed for {output_file_prompt}: {str(e)}") 
\ No newline at end of file
+# Verify the output files. Every line was produced by the JSON serializer, so it is valid JSON by
+# construction; a cheap line count is enough to catch a truncated or partially written file.
+for output_file, num_lines in ((output_file_messages, num_lines_messages), (output_file_prompt, num_lines_prompt)):
+    if not num_lines:
+        continue
+    lines_on_disk = count_lines(output_file)
+    if lines_on_disk == num_lines:
+        print(f"Verification successful: {output_file} contains {lines_on_disk} lines.")
+    else:
+        print(f"Verification failed for {output_file}: wrote {num_lines} lines, found {lines_on_disk}.")
@@ -11,6 +11,11 @@ PROCESSED_DATA_DIR = "processed_data"
 UPLOADED_IMAGES_DIR = "uploaded_images"
 STATIC_DIR = "static"
 LOG_DIR = "logs" # For future structured logging
+EMBEDDING_JOBS_DIR = "embedding_jobs" # Status files of background embedding jobs (shared by all worker processes)
+
+# --- Uploads ---
+UPLOAD_CHUNK_SIZE = 1 << 20 # Uploaded files are copied to disk in 1 MiB chunks instead of being read into memory whole
+PDF_PROCESSING_WORKERS = 2 # Processes per server worker that parse uploaded PDFs, one file each (the Docker image runs 4 server workers)
 
 # --- ChromaDB Settings ---
 # Collection names
@@ -26,13 +31,29 @@ VISION_MODEL_ID = "gpt-4-turbo" # As used in vision_analyzer.py - ensure consist
 # --- Image Processing ---
 ALLOWED_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp"}
 IMAGE_SIMILARITY_THRESHOLD = 0.70 # For matching uploaded images to known symbols
+PRELOAD_IMAGE_EMBEDDING_MODEL = True # Load the CLIP model at server startup instead of on the first request
+
+# --- Static File Caching ---
+# UI files keep their names across releases, so browsers revalidate them (via ETag) after a few minutes.
+STATIC_CACHE_CONTROL = "public, max-age=300"
+# Uploaded images are saved under fresh UUID names and never change, so they can be cached for good.
+UPLOADED_IMAGES_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 # --- API Behavior ---
 DEFAULT_SEARCH_TOP_K = 3
+QUERY_EMBEDDING_CACHE_SIZE = 4096 # Normalized /search queries whose embeddings each worker process keeps in memory
+MAX_BATCH_SEARCH_QUERIES = 32 # Upper limit on the number of queries in one /search/batch request
+
+# --- Answer Cache ---
+# Generated /search answers are reused for the same query and retrieved context.
+ANSWER_CACHE_DIR = "answer_cache"
+ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
 
 # --- Logging ---
 LOG_LEVEL = "INFO" # e.g., DEBUG, INFO, WARNING, ERROR, CRITICAL
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_MAX_BYTES = 50_000_000 # Each worker's logs/app.<pid>.log is rotated at this size...
+LOG_BACKUP_COUNT = 5 # ...keeping this many old files (app.<pid>.log.1 ... app.<pid>.log.5)
 
 # --- CORS Settings ---
 CORS_ALLOW_ORIGINS = ["*"] # Allows all origins in development
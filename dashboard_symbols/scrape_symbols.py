@@ -1,10 +1,29 @@
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 import pandas as pd
 import re
-import time
 
-def scrape_warning_lights(url):
+# Matches warning-light section headings ("... Warning Light ..." or "12. ...").
+# Compiled once and without the leading/trailing ".*", which only added backtracking to each search.
+SECTION_HEADING_PATTERN = re.compile(r'Warning Light|^\d+\.\s+')
+# Strips the leading "12. " numbering from a section heading.
+NUMBERING_PATTERN = re.compile(r'^\d+\.\s+')
+# Number of pages fetched concurrently; fetching is network-bound, so threads overlap the round-trips.
+MAX_CONCURRENT_FETCHES = 8
+
+def create_session(pool_size=MAX_CONCURRENT_FETCHES):
+    """Creates a requests session whose keep-alive connection pool is shared by all fetch threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def scrape_warning_lights(url, session=None):
+    # Reuse the caller's session (and its open connections) when one is provided
+    http = session or requests
     # Add headers to mimic a browser request
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -12,11 +31,11 @@ def scrape_warning_lights(url):
     
     try:
         # Get the webpage content
-        response = requests.get(url, headers=headers)
+        response = http.get(url, headers=headers)
         response.raise_for_status()
         
-        # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # Parse the HTML content with the C-based lxml parser (much faster than html.parser)
+        soup = BeautifulSoup(response.text, 'lxml')
         
         # Initialize lists to store data
         symbol_names = []
@@ -24,13 +43,13 @@ def scrape_warning_lights(url):
         meanings = []
         
         # Find all warning light sections
-        warning_sections = soup.find_all(['h2', 'h3', 'h4'], string=re.compile(r'.*Warning Light.*|^\d+\.\s+.*'))
+        warning_sections = soup.find_all(['h2', 'h3', 'h4'], string=SECTION_HEADING_PATTERN)
         
         for section in warning_sections:
             # Get the symbol name
             symbol_name = section.get_text().strip()
             # Remove numbering if present
-            symbol_name = re.sub(r'^\d+\.\s+', '', symbol_name)
+            symbol_name = NUMBERING_PATTERN.sub('', symbol_name)
             
             # Find associated image and meaning
             image_url = ""
@@ -97,9 +116,6 @@ def scrape_warning_lights(url):
             symbol_names.append(symbol_name)
             meanings.append(meaning)
             image_urls.append(image_url)
-            
-            # Add a small delay to be respectful to the server
-            time.sleep(0.5)
         
         # Create DataFrame
         data = {
@@ -131,16 +147,26 @@ def main():
         "https://carwarninglights.net/warning-light/toyota-hilux-dashboard-symbols/"
     ]
     
-    # Initialize empty DataFrame to store all data
-    all_data = pd.DataFrame()
+    # Fetch and parse all pages concurrently over one pooled session
+    with create_session() as session, ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES) as executor:
+        dfs = list(executor.map(lambda url: scrape_warning_lights(url, session), urls))
     
-    # Process each URL
-    for url in urls:
-        print(f"\nProcessing {url}...")
-        df = scrape_warning_lights(url)
+    # Combine the results, preserving the URL order
+    scraped = []
+    for url, df in zip(urls, dfs):
         if df is not None:
-            all_data = pd.concat([all_data, df], ignore_index=True)
+            scraped.append(df)
             print(f"Successfully scraped {len(df)} symbols from {url}")
+    all_data = pd.concat(scraped, ignore_index=True) if scraped else pd.DataFrame()
+    
+    if not all_data.empty:
+        # The same symbol appears on several model pages; keep one row per normalized
+        # name + meaning so it is only embedded once downstream.
+        dedup_key = (all_data['symbol_name'].str.lower().str.strip() + '|' +
+                     all_data['meaning'].str.lower().str.strip())
+        num_scraped = len(all_data)
+        all_data = all_data[~dedup_key.duplicated()].reset_index(drop=True)
+        print(f"Removed {num_scraped - len(all_data)} duplicate symbols")
     
     if not all_data.empty:
         # Save to CSV in current directory
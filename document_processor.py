@@ -1,9 +1,26 @@
 # Handles PDF processing: text extraction, chunking, and validation.
 import PyPDF2
+# PyMuPDF extracts text in C (MuPDF) and is several times faster than PyPDF2; PyPDF2 is
+# used as a fallback when it is not installed.
+try:
+    import fitz
+except ImportError:
+    fitz = None
 import json # Not directly used, but PyPDF2 might interact with JSON-like structures.
 import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from storage_utils import save_chunks_to_json
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Minimum number of pages handed to each extraction worker process; below this, process
+# start-up costs more than it saves. MuPDF pages are much cheaper, so it needs larger ranges.
+MIN_PAGES_PER_WORKER = 128 if fitz is not None else 16
+# Minimum number of words for a chunk to be considered meaningful.
+MIN_CHUNK_WORDS = 10
+WORD_PATTERN = re.compile(r'\S+')
 
 def validate_chunk(chunk: str) -> bool:
     """Validates if a text chunk is meaningful (e.g., min 10 words).
@@ -14,10 +31,22 @@ def validate_chunk(chunk: str) -> bool:
     Returns:
         True if the chunk is valid, False otherwise.
     """
-    # Basic check for minimum word count.
-    if len(chunk.split()) < 10: # Arbitrary minimum word count.
-        return False
-    return True
+    # Basic check for minimum word count; stops scanning once enough words are found.
+    words = WORD_PATTERN.finditer(chunk)
+    return sum(1 for _ in zip(range(MIN_CHUNK_WORDS), words)) == MIN_CHUNK_WORDS
+
+def _chunk_spans(num_words: int, target_chunk_words: int, overlap_words: int) -> List[Tuple[int, int]]:
+    """Computes the (start, end) word offsets of each chunk, end exclusive.
+
+    Chunks start every `target_chunk_words - overlap_words` words. The last start is the first one
+    whose chunk reaches the end of the text, so the whole text is covered without any tail
+    special-casing, and consecutive spans are always distinct.
+    """
+    if num_words == 0:
+        return []
+    stride = target_chunk_words - overlap_words
+    return [(start, min(start + target_chunk_words, num_words))
+            for start in range(0, max(1, num_words - overlap_words), stride)]
 
 def chunk_text_by_word_count(text: str, target_chunk_words: int = 250, overlap_words: int = 50) -> List[str]:
     """Splits text into chunks by word count with overlap, ensuring full text coverage.
@@ -30,108 +59,139 @@ def chunk_text_by_word_count(text: str, target_chunk_words: int = 250, overlap_w
     Returns:
         A list of text chunks.
     """
-    
     words = text.split()
-    if not words:
-        return []
+    join = " ".join # Local binding: avoids the attribute lookup for every chunk.
+    # Chunk strings are only built once per span; boundaries are worked out on integer offsets.
+    # (A plain slice is used on purpose: islice would walk the list from the start for every chunk.)
+    return [join(words[start:end]) for start, end in _chunk_spans(len(words), target_chunk_words, overlap_words)]
+
+def _stream_chunks(tagged_words: Iterable[Tuple[str, int]], target_chunk_words: int,
+                   overlap_words: int) -> Iterator[Tuple[str, int, int]]:
+    """Chunks a stream of (word, page_number) pairs with a sliding window, without materializing the text.
+
+    Produces exactly the chunks of _chunk_spans over the same words, but only ever holds one
+    window of target_chunk_words words in memory.
+
+    Yields:
+        (chunk_text, word_count, page_number_of_first_word) for each chunk, in order.
+    """
+    stride = target_chunk_words - overlap_words
+    window = deque(maxlen=target_chunk_words)
+    next_start = 0 # Word index at which the next chunk starts.
+    num_words = 0
+    for tagged_word in tagged_words:
+        window.append(tagged_word)
+        num_words += 1
+        # Once the window holds words [next_start, next_start + target), that chunk is complete.
+        if num_words == next_start + target_chunk_words:
+            yield " ".join(word for word, _ in window), target_chunk_words, window[0][1]
+            next_start += stride
+
+    # The final chunk is shorter than the target when the text does not end on a window boundary;
+    # as in _chunk_spans, it is emitted only if it reaches past the previous chunk's overlap.
+    if num_words and next_start < max(1, num_words - overlap_words):
+        tail = list(window)[next_start - num_words:]
+        yield " ".join(word for word, _ in tail), len(tail), tail[0][1]
+
+
+def _iter_page_range(pdf_path: str, start_page: int, end_page: int) -> Iterator[str]:
+    """Yields the text of pages [start_page, end_page) from a PDF, one page at a time.
+
+    Args:
+        pdf_path: The path to the PDF file.
+        start_page: Index of the first page to extract.
+        end_page: Index one past the last page to extract.
+
+    Yields:
+        The extracted text of each page, in page order.
+    """
+    if fitz is not None:
+        with fitz.open(pdf_path) as doc:
+            for page_num in range(start_page, end_page):
+                yield doc[page_num].get_text()
+        return
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page_num in range(start_page, end_page):
+            yield reader.pages[page_num].extract_text()
+
+def _extract_page_range(pdf_path: str, start_page: int, end_page: int) -> List[str]:
+    """Extracts the text of pages [start_page, end_page) from a PDF.
 
-    chunks = []
-    current_pos = 0
-    # Iterate through the words to create chunks.
-    while current_pos < len(words):
-        start_pos = current_pos
-        end_pos = min(current_pos + target_chunk_words, len(words))
-        chunk_list = words[start_pos:end_pos]
-        chunks.append(" ".join(chunk_list))
-        
-        # Advance current_pos by the target chunk size minus the overlap.
-        current_pos += (target_chunk_words - overlap_words)
-        
-        # Special handling for the end of the text to ensure the last part is included.
-        if current_pos >= len(words) - overlap_words and end_pos < len(words):
-            # If the remaining text is less than or equal to the target chunk size,
-            # and it's not already the last chunk created, add it as a new chunk.
-            if len(words) - start_pos <= target_chunk_words:
-                 if words[start_pos:] != chunk_list: # Avoid duplicate final chunk.
-                    chunks.append(" ".join(words[start_pos:]))
-                 break # Exit loop as the entire text has been processed.
-        elif end_pos == len(words):
-            # If the end_pos reaches the end of the words list, it means the last chunk is formed.
-            break
-            
-    # Fallback to capture the very last segment if it was missed by the primary loop logic.
-    # This can happen if the remaining text is smaller than the overlap.
-    if chunks:
-        last_chunk_words = chunks[-1].split()
-        # Check if there are words in the text and the last chunk is not empty,
-        # and the last word of the text is different from the last word of the last chunk.
-        if words and last_chunk_words and words[-1] != last_chunk_words[-1]:
-            # Define the start of the potential new chunk, ensuring it's within bounds.
-            final_chunk_start = max(0, len(words) - target_chunk_words)
-            potential_new_chunk = " ".join(words[final_chunk_start:])
-            # Add the potential new chunk if it's different from the last chunk already added.
-            if chunks[-1] != potential_new_chunk: # Avoid exact duplication.
-                    chunks.append(potential_new_chunk)
-
-    return [chunk for chunk in chunks if chunk.strip()] # Filter out empty strings.
-
-
-def process_pdf(pdf_path: str) -> Dict:
+    Opens its own document so it can run in a worker process (open PDF handles aren't picklable).
+    """
+    return list(_iter_page_range(pdf_path, start_page, end_page))
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """Returns the number of pages in a PDF."""
+    if fitz is not None:
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    with open(pdf_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+def extract_page_texts(pdf_path: str, num_pages: int, max_workers: Optional[int] = None) -> Iterator[str]:
+    """Extracts the text of every page of a PDF, fanning page ranges out across processes.
+
+    Text extraction is CPU-bound (and PyPDF2's is pure Python), so separate processes (not
+    threads) are needed to use more than one core. Small documents are extracted in-process,
+    lazily, one page at a time.
+
+    Args:
+        pdf_path: The path to the PDF file.
+        num_pages: The number of pages in the PDF.
+        max_workers: Upper limit on the number of worker processes (default: one per core).
+            Pass 1 when already running in a worker process, to extract in-process.
+
+    Yields:
+        The extracted text of each page, in page order.
+    """
+    num_workers = min(max_workers or os.cpu_count() or 1, max(1, num_pages // MIN_PAGES_PER_WORKER))
+    if num_workers <= 1:
+        yield from _iter_page_range(pdf_path, 0, num_pages)
+        return
+
+    # Split the pages into one contiguous range per worker; map() preserves their order.
+    bounds = [num_pages * i // num_workers for i in range(num_workers + 1)]
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for page_range in executor.map(_extract_page_range, repeat(pdf_path), bounds[:-1], bounds[1:]):
+            yield from page_range
+
+def process_pdf(pdf_path: str, max_workers: Optional[int] = None) -> Dict:
     """Extracts text from PDF, chunks, validates, and saves to JSON.
 
     Args:
         pdf_path: The path to the PDF file.
+        max_workers: Upper limit on the processes used for text extraction (see extract_page_texts).
 
     Returns:
         A dictionary containing processing results, including the number of pages,
         number of chunks, and the output file path.
     """
-    with open(pdf_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        num_pages = len(reader.pages)
-        all_text = ""
-
-        # Extract text from each page.
-        for page_num in range(num_pages):
-            page_text = reader.pages[page_num].extract_text()
-            if page_text:
-                all_text += page_text + "\n" # Newline as page separator.
-        
-        # Chunk the extracted text.
-        text_chunks = chunk_text_by_word_count(all_text, target_chunk_words=250, overlap_words=50)
-        
-        chunks_data = []
-        # Approximate page number for each chunk.
-        # This is a best-effort calculation.
-        chunks_per_page_approx = 0
-        if num_pages > 0 and len(text_chunks) > 0:
-            chunks_per_page_approx = max(1, len(text_chunks) // num_pages)
-
-        for i, chunk_text in enumerate(text_chunks):
-            if validate_chunk(chunk_text):
-                page_number_for_chunk = 1 # Default page number.
-                if chunks_per_page_approx > 0:
-                    # Calculate page index based on approximate chunks per page.
-                    page_idx = i // chunks_per_page_approx
-                    page_number_for_chunk = page_idx + 1 
-                elif num_pages > 0:
-                    # If approximation is not possible, assign sequentially up to num_pages.
-                    page_number_for_chunk = min(i + 1, num_pages)
-                else: 
-                    page_number_for_chunk = 0 # Indicates no pages or invalid PDF.
-
-                if num_pages > 0:
-                    # Ensure page number does not exceed the actual number of pages.
-                    page_number_for_chunk = min(page_number_for_chunk, num_pages)
-                
-                chunks_data.append({
-                    "id": f"chunk_{i+1}",
-                    "text": chunk_text,
-                    "page_number": str(page_number_for_chunk) if page_number_for_chunk > 0 else "N/A"
-                })
-            else:
-                # Log skipped chunks for debugging or information.
-                print(f"Skipping invalid chunk {i+1} (too short/not alphanumeric).")
+    num_pages = count_pdf_pages(pdf_path)
+
+    # Stream the words of each page (extracted in parallel for larger documents), tagged with
+    # their page number, straight into the chunker; the full text is never held in memory.
+    tagged_words = (
+        (word, page_number)
+        for page_number, page_text in enumerate(extract_page_texts(pdf_path, num_pages, max_workers), start=1)
+        if page_text
+        for word in page_text.split()
+    )
+
+    # Each chunk is labelled with the page its first word is on.
+    chunks_data = []
+    for i, (chunk_text, word_count, page_number) in enumerate(_stream_chunks(tagged_words, target_chunk_words=250, overlap_words=50)):
+        # The word count is known from the chunker, so short chunks are rejected without re-scanning their text.
+        if word_count >= MIN_CHUNK_WORDS:
+            chunks_data.append({
+                "id": f"chunk_{i+1}",
+                "text": chunk_text,
+                "page_number": str(page_number)
+            })
+        else:
+            # Log skipped chunks for debugging or information.
+            print(f"Skipping invalid chunk {i+1} (too short/not alphanumeric).")
 
     # Save the processed chunks to a JSON file.
     output_file = save_chunks_to_json(chunks_data, source_pdf=pdf_path)
@@ -141,4 +201,12 @@ def process_pdf(pdf_path: str) -> Dict:
         "num_pages": num_pages,
         "num_chunks": len(chunks_data),
         "output_file": output_file
-    } 
\ No newline at end of file
+    } 
+
+def process_pdf_in_worker(pdf_path: str) -> Dict:
+    """Runs process_pdf in a process of a shared pool (such as the API server's).
+
+    Pages are extracted within this process (max_workers=1), so the pool's size alone bounds
+    the number of processes; a large file doesn't start a nested pool of its own.
+    """
+    return process_pdf(pdf_path, max_workers=1)
@@ -0,0 +1,61 @@
+# Local on-disk cache of text embeddings, so re-ingesting unchanged text skips the embeddings API.
+import hashlib
+import os
+import sqlite3
+from array import array
+from contextlib import closing
+from typing import Dict, List, Optional
+
+# SQLite file holding the cached vectors. One row per (model, text) pair.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+# SQLite limits the number of bound parameters per statement; lookups are split accordingly.
+_LOOKUP_CHUNK_SIZE = 500
+
+def _connect() -> sqlite3.Connection:
+    """Opens a connection to the cache database, creating the table on first use.
+    A fresh connection is used per call, so the cache is safe to use from any thread or worker process.
+    """
+    directory = os.path.dirname(EMBEDDING_CACHE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(EMBEDDING_CACHE_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL") # Readers don't block the writer (and vice versa).
+    conn.execute("CREATE TABLE IF NOT EXISTS emb_cache (h TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+    return conn
+
+def _key(model: str, text: str) -> str:
+    """Cache key: embeddings depend on both the model and the exact text."""
+    return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+def get_cached_embeddings(texts: List[str], model: str) -> List[Optional[List[float]]]:
+    """Looks up cached embeddings for texts.
+
+    Args:
+        texts (List[str]): The texts to look up.
+        model (str): The embedding model the vectors must come from.
+
+    Returns:
+        List[Optional[List[float]]]: One entry per text, in input order; None where the text is not cached.
+    """
+    keys = [_key(model, text) for text in texts]
+    found: Dict[str, bytes] = {}
+    with closing(_connect()) as conn, conn: # Commits the transaction, then closes the connection.
+        for i in range(0, len(keys), _LOOKUP_CHUNK_SIZE):
+            chunk = keys[i:i + _LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(conn.execute(f"SELECT h, vec FROM emb_cache WHERE h IN ({placeholders})", chunk))
+    # Vectors are stored as raw float32 bytes (the precision the API returns).
+    return [array('f', found[key]).tolist() if key in found else None for key in keys]
+
+def cache_embeddings(texts: List[str], embeddings: List[List[float]], model: str):
+    """Stores embeddings for texts; texts that are already cached are left untouched.
+
+    Args:
+        texts (List[str]): The embedded texts.
+        embeddings (List[List[float]]): The embedding of each text, in the same order.
+        model (str): The embedding model that produced the vectors.
+    """
+    rows = [(_key(model, text), array('f', embedding).tobytes())
+            for text, embedding in zip(texts, embeddings)]
+    with closing(_connect()) as conn, conn:
+        conn.executemany("INSERT OR IGNORE INTO emb_cache (h, vec) VALUES (?, ?)", rows)
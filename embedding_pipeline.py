@@ -1,27 +1,64 @@
 # This module defines the pipeline for generating and storing embeddings for processed documents.
-import json
+import orjson
 import os
-from typing import List, Dict
+import queue
+import threading
+from typing import List, Dict, Set
 from embeddings import create_embeddings # Function to create embeddings from text.
 from chroma_store import store_embeddings, DEFAULT_COLLECTION_NAME # Function to store embeddings in ChromaDB and get default name.
-from datetime import datetime # For timestamping metadata.
+from datetime import datetime, timezone # For timestamping metadata.
 
-def process_json_for_embeddings(json_path: str, collection_name: str) -> Dict:
+# Number of chunks written to ChromaDB per upsert. Moderate batches (~50-250) keep each
+# write a small SQLite transaction instead of one huge commit for the whole document.
+BATCH_SIZE = int(os.getenv("CHROMA_INSERT_BATCH_SIZE", "200"))
+# Number of chunks embedded per pipeline step. While one slice is written to ChromaDB the
+# next one is already being embedded; slices are large enough to keep every concurrent
+# embedding request of create_embeddings busy.
+EMBED_SLICE_SIZE = 2000
+
+def _embed_slices(texts: List[str], slice_size: int, slices: queue.Queue, stop: threading.Event):
+    """Producer thread: embeds texts slice by slice and queues (start, embeddings) for each one.
+    Queues None when done, or the exception if embedding fails. Stops early once `stop` is set.
+    """
+    def put(item) -> bool:
+        # Blocks while the consumer is behind, but gives up if the consumer has stopped listening.
+        while not stop.is_set():
+            try:
+                slices.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for start in range(0, len(texts), slice_size):
+            if stop.is_set() or not put((start, create_embeddings(texts[start:start + slice_size]))):
+                return
+    except Exception as e:
+        put(e)
+        return
+    put(None)
+
+def process_json_for_embeddings(json_path: str, collection_name: str, batch_size: int = BATCH_SIZE) -> Dict:
     """Processes a JSON file containing text chunks, generates embeddings for these chunks,
     and stores them in the specified ChromaDB vector store collection.
 
     Args:
         json_path (str): Path to the JSON file containing text chunks.
         collection_name (str): Name of the ChromaDB collection to store embeddings in.
+        batch_size (int): Number of chunks written to ChromaDB per upsert.
 
     Returns:
         A dictionary summarizing the embedding process, including input/output file paths,
         number of embeddings generated, and embedding dimension.
     """
     # Load data from the JSON file.
-    with open(json_path, 'r') as f:
-        data = json.load(f)
+    with open(json_path, 'rb') as f:
+        data = orjson.loads(f.read())
     
+    # All chunks of one run share a single ingest timestamp.
+    timestamp = datetime.now(timezone.utc).isoformat()
+
     # Extract text content from each chunk.
     texts = [chunk['text'] for chunk in data['chunks']]
     # Prepare metadata for each chunk, including source PDF, chunk index, and timestamp.
@@ -29,7 +66,7 @@ def process_json_for_embeddings(json_path: str, collection_name: str) -> Dict:
         'source': data['source_pdf'], 
         'chunk_index': i,
         'original_text_id': chunk.get('id', f'chunk_{i}'), # Use original chunk ID if available, else generate
-        'timestamp': datetime.now().isoformat()
+        'timestamp': timestamp
     } for i, chunk in enumerate(data['chunks'])] # Iterate with chunk for original_text_id
     
     # Generate unique IDs for ChromaDB for each chunk
@@ -40,12 +77,44 @@ def process_json_for_embeddings(json_path: str, collection_name: str) -> Dict:
         for i, meta in enumerate(metadata)
     ]
 
-    # Generate embeddings for the extracted texts.
-    embeddings_data = create_embeddings(texts)
+    # Embed the texts in slices on a producer thread while the previous slice is stored in
+    # ChromaDB. The queue holds at most two finished slices, bounding memory if storing falls behind.
+    slices = queue.Queue(maxsize=2)
+    stop = threading.Event()
+    producer = threading.Thread(target=_embed_slices, args=(texts, EMBED_SLICE_SIZE, slices, stop), daemon=True)
+    producer.start()
 
-    if not embeddings_data or len(texts) != len(embeddings_data) or len(texts) != len(chroma_ids) or len(texts) != len(metadata):
-        # Handle error: mismatch in list lengths or no embeddings generated
+    num_embeddings = 0
+    embedding_dimension = 0
+    error_msg = None
+    try:
+        while (item := slices.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            start, embeddings_data = item
+            end = min(start + EMBED_SLICE_SIZE, len(texts))
+            if len(embeddings_data) != end - start:
+                error_msg = "Mismatch in data lengths or no embeddings generated. Cannot store."
+                break
+
+            # Store the generated embeddings along with their texts and metadata in ChromaDB.
+            store_embeddings(
+                texts=texts[start:end],
+                embeddings=embeddings_data,
+                ids=chroma_ids[start:end],
+                collection_name=collection_name,
+                metadata=metadata[start:end],
+                batch_size=batch_size
+            )
+            num_embeddings += len(embeddings_data)
+            embedding_dimension = embedding_dimension or len(embeddings_data[0])
+    finally:
+        stop.set() # Lets the producer exit if we stopped consuming early.
+
+    if num_embeddings == 0 and error_msg is None:
         error_msg = "Mismatch in data lengths or no embeddings generated. Cannot store."
+    if error_msg is not None:
+        # Handle error: mismatch in list lengths or no embeddings generated
         print(f"Error in process_json_for_embeddings: {error_msg}")
         # Optionally, return an error structure or raise an exception
         return {
@@ -57,53 +126,32 @@ def process_json_for_embeddings(json_path: str, collection_name: str) -> Dict:
             "error": True
         }
 
-    # Store the generated embeddings along with their texts and metadata in ChromaDB.
-    store_embeddings(
-        texts=texts, 
-        embeddings=embeddings_data,
-        ids=chroma_ids, 
-        collection_name=collection_name,
-        metadata=metadata
-    )
-    
     output_file_basename = os.path.basename(json_path).split('.')[0]
     output_file = os.path.join('embedded_data', f"{output_file_basename}_embedded.json")
     os.makedirs('embedded_data', exist_ok=True) # Ensure the directory exists.
     
-    with open(output_file, 'w') as f:
-        json.dump({"status": "embeddings_generated", "source_json": json_path, "collection": collection_name}, f)
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps({"status": "embeddings_generated", "source_json": json_path, "collection": collection_name}))
 
     return {
         "input_file": json_path,
         "output_file": output_file, 
-        "num_embeddings": len(embeddings_data) if embeddings_data else 0,
-        "embedding_dimension": len(embeddings_data[0]) if embeddings_data and embeddings_data[0] else 0,
+        "num_embeddings": num_embeddings,
+        "embedding_dimension": embedding_dimension,
         "message": f"Successfully generated and stored embeddings in ChromaDB collection '{collection_name}'"
     }
 
+def _stems(directory: str, suffix: str) -> Set[str]:
+    """Returns the names of files in `directory` ending with `suffix`, with the suffix removed."""
+    if not os.path.isdir(directory):
+        return set()
+    with os.scandir(directory) as entries:
+        return {entry.name.removesuffix(suffix) for entry in entries if entry.name.endswith(suffix) and entry.is_file()}
+
 def get_pending_documents() -> List[str]:
     """Identifies processed JSON documents in 'processed_data' that are pending embedding generation.
     This is done by comparing files in 'processed_data' against marker files in 'embedded_data'.
     """
-    processed_dir = "processed_data"
-    embedded_dir = "embedded_data"
-    
-    # If the directory for processed data doesn't exist, there are no pending documents.
-    if not os.path.exists(processed_dir):
-        return []
-    
-    # Get a set of all JSON files in the processed_data directory.
-    processed_files = set(f for f in os.listdir(processed_dir) if f.endswith('.json'))
-    
-    # Get a set of marker files from embedded_data, adjusting names to match processed_files.
-    embedded_files_markers = set()
-    if os.path.exists(embedded_dir):
-        embedded_files_markers = set(
-            f.replace('_embedded.json', '.json') 
-            for f in os.listdir(embedded_dir) 
-            if f.endswith('_embedded.json')
-        )
-    
-    # The difference between these sets gives the files that are processed but not yet embedded.
-    pending_files = list(processed_files - embedded_files_markers)
-    return pending_files 
\ No newline at end of file
+    # Documents are matched on their stem: 'manual.json' is done once 'manual_embedded.json' exists.
+    pending_stems = _stems("processed_data", ".json") - _stems("embedded_data", "_embedded.json")
+    return [f"{stem}.json" for stem in pending_stems]
@@ -1,87 +1,218 @@
 # This module is responsible for generating text embeddings using OpenAI's API.
-from openai import OpenAI
-# import httpx # No longer needed for basic init with openai > 1.x, library handles it.
-from typing import List
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+import httpx # Used to configure the shared HTTP connection pool of the OpenAI client.
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+import logging
 import os
-from time import sleep # Used for adding delays to avoid API rate limits.
+import numpy as np
+from time import sleep # Used for backing off when the API rate-limits a request.
 from dotenv import load_dotenv # For loading environment variables from a .env file.
+import sqlite3
+from embedding_cache import get_cached_embeddings, cache_embeddings # Local cache of previously generated embeddings.
+
+# tiktoken gives exact token counts for batch packing; without it, a ~4 characters per token
+# estimate is used, which is close enough to stay well under the request limit.
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
 
 # Load environment variables from a .env file in the project root.
 # This is where the OPENAI_API_KEY should be stored.
 load_dotenv()
 
+# Per-batch and per-query messages are logged at DEBUG, so they cost nothing unless enabled;
+# run totals are logged at INFO.
+logger = logging.getLogger(__name__)
+
 # Initialize the OpenAI client.
 # The API key is fetched from environment variables (loaded from .env or system env).
 # Ensure OPENAI_API_KEY is set in your .env file or system environment variables for this to work.
+# The client is shared by every module (embeddings, chat completions, vision) and keeps its connections
+# alive between requests. HTTP/2 lets concurrent requests (e.g. parallel embedding batches) share
+# one TLS connection instead of each opening its own.
 client = OpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
-    base_url="https://api.openai.com/v1"  # Explicitly set the base URL for project-scoped keys
+    base_url="https://api.openai.com/v1",  # Explicitly set the base URL for project-scoped keys
+    http_client=httpx.Client(
+        http2=True,
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    ),
+)
+
+# Async twin of the client for code running on an event loop (e.g. chat completions awaited in FastAPI
+# endpoints), so a slow model response doesn't hold a thread. Same pool settings, separate connections.
+async_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url="https://api.openai.com/v1",
+    http_client=httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    ),
 )
 
 # Default model for embeddings. This can be updated to use other OpenAI embedding models.
 EMBEDDING_MODEL = "text-embedding-3-small"
 
-def create_embeddings(texts: List[str], batch_size: int = 100) -> List[List[float]]:
-    """
-    Generates embeddings for a list of text strings using the specified OpenAI API model.
-    Processes texts in batches to manage API rate limits and request sizes effectively.
-    """
-    if not texts: # Check if the input list is empty.
-        print("Input text list is empty. No embeddings will be generated.")
-        return []
+# Maximum number of embedding requests in flight at once. Batch requests are pure network
+# I/O, so overlapping their round-trips cuts wall-clock time roughly by this factor.
+MAX_CONCURRENT_REQUESTS = 8
+# Request limits of the embeddings endpoint: at most 2048 inputs and ~300k tokens per request.
+# Batches are packed up to a 250k token budget, leaving headroom for estimation error.
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 250_000
+# Retry policy for rate-limited requests: wait 1s, 2s, 4s, ... between attempts.
+MAX_RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_BACKOFF_SECONDS = 1.0
 
-    all_embeddings = [] # Initialize an empty list to store all generated embeddings.
-    
-    print(f"\nAttempting to generate embeddings for {len(texts)} text chunks using model '{EMBEDDING_MODEL}'.")
-    
-    # Process texts in batches to avoid overwhelming the API or hitting request size limits.
-    for i in range(0, len(texts), batch_size):
-        batch_texts = texts[i:i + batch_size] # Get the current batch of texts.
-        current_batch_num = (i // batch_size) + 1
-        total_batches = (len(texts) + batch_size - 1) // batch_size # Calculate total number of batches.
-        
+def _embed_batch(batch_texts: List[str], batch_num: int, total_batches: int) -> List[List[float]]:
+    """Embeds one batch of texts, backing off exponentially when the API rate-limits the request."""
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
         try:
-            print(f"Processing batch {current_batch_num} of {total_batches} (size: {len(batch_texts)} texts)..._model")
-            
+            logger.debug("Processing batch %d of %d (size: %d texts)...", batch_num, total_batches, len(batch_texts))
+
             # Call the OpenAI API's embeddings creation endpoint.
             response = client.embeddings.create(
                 model=EMBEDDING_MODEL, # Specify the embedding model to use.
                 input=batch_texts      # Provide the batch of texts as input.
             )
-            
+
             # Extract the embedding vectors from the API response object.
             # response.data is a list of embedding objects, each having an 'embedding' attribute.
             batch_embeddings = [embedding.embedding for embedding in response.data]
-            all_embeddings.extend(batch_embeddings) # Add the generated embeddings for this batch to the main list.
-            
-            print(f"Successfully generated {len(batch_embeddings)} embeddings for batch {current_batch_num}.")
-            
-            # Implement a brief pause to respect API rate limits, especially if processing many batches.
-            if current_batch_num < total_batches: # Only sleep if there are more batches to process.
-                sleep(0.5) # Delay for 0.5 seconds
-                
+            logger.debug("Successfully generated %d embeddings for batch %d.", len(batch_embeddings), batch_num)
+            return batch_embeddings
+
+        except RateLimitError as e:
+            if attempt == MAX_RATE_LIMIT_RETRIES:
+                logger.error("Error generating embeddings for batch %d: rate limit retries exhausted - %s", batch_num, e)
+                raise
+            delay = RATE_LIMIT_BACKOFF_SECONDS * (2 ** attempt)
+            logger.warning("Batch %d was rate-limited; retrying in %.1fs...", batch_num, delay)
+            sleep(delay)
         except Exception as e:
             # Handle exceptions that might occur during the API call for a batch.
-            print(f"Error generating embeddings for batch {current_batch_num}: {type(e).__name__} - {str(e)}")
+            logger.error("Error generating embeddings for batch %d: %s - %s", batch_num, type(e).__name__, e)
             # For critical errors (e.g., authentication), re-raising might be appropriate.
             raise # Re-raise the exception to be handled by the caller or to stop execution.
-            
-    print(f"\nCompleted generating {len(all_embeddings)} embeddings in total.")
+
+def _token_counter() -> Callable[[str], int]:
+    """Returns a function counting the tokens of a text for EMBEDDING_MODEL (estimated without tiktoken)."""
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+            return lambda text: len(encoding.encode_ordinary(text))
+        except Exception as e:
+            logger.warning("Could not load tiktoken encoding for '%s', estimating token counts: %s", EMBEDDING_MODEL, e)
+    return lambda text: len(text) // 4 + 1
+
+def _pack_batches(texts: List[str], max_inputs: int, max_tokens: int) -> List[List[str]]:
+    """Splits texts into consecutive batches of at most max_inputs texts and max_tokens tokens each."""
+    count_tokens = _token_counter()
+    batches = []
+    current_batch, current_tokens = [], 0
+    for text in texts:
+        text_tokens = count_tokens(text)
+        # Flush before this text would push the batch over either limit (a batch always gets at least one text).
+        if current_batch and (len(current_batch) == max_inputs or current_tokens + text_tokens > max_tokens):
+            batches.append(current_batch)
+            current_batch, current_tokens = [], 0
+        current_batch.append(text)
+        current_tokens += text_tokens
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+def create_embeddings(texts: List[str],
+                      batch_size: int = MAX_INPUTS_PER_REQUEST,
+                      max_tokens_per_batch: int = MAX_TOKENS_PER_REQUEST,
+                      use_cache: bool = True) -> List[List[float]]:
+    """
+    Generates embeddings for a list of text strings using the specified OpenAI API model.
+    Texts are packed into as few requests as the API allows (bounded by batch_size inputs and
+    max_tokens_per_batch tokens per request), with several requests in flight at once.
+    With use_cache, texts embedded before are served from the local embedding cache and only
+    the rest is sent to the API.
+    """
+    if not texts: # Check if the input list is empty.
+        logger.warning("Input text list is empty. No embeddings will be generated.")
+        return []
+
+    if not use_cache:
+        return _create_embeddings_uncached(texts, batch_size, max_tokens_per_batch)
+
+    try:
+        cached = get_cached_embeddings(texts, EMBEDDING_MODEL)
+    except sqlite3.Error as e:
+        logger.warning("Embedding cache unavailable, embedding all texts: %s", e)
+        return _create_embeddings_uncached(texts, batch_size, max_tokens_per_batch)
+
+    miss_positions = [i for i, embedding in enumerate(cached) if embedding is None]
+    logger.info("Embedding cache: %d of %d texts cached.", len(texts) - len(miss_positions), len(texts))
+    if miss_positions:
+        miss_texts = [texts[i] for i in miss_positions]
+        miss_embeddings = _create_embeddings_uncached(miss_texts, batch_size, max_tokens_per_batch)
+        try:
+            cache_embeddings(miss_texts, miss_embeddings, EMBEDDING_MODEL)
+        except sqlite3.Error as e:
+            logger.warning("Could not write embeddings to the cache: %s", e)
+        for i, embedding in zip(miss_positions, miss_embeddings):
+            cached[i] = embedding
+    return cached
+
+def _create_embeddings_uncached(texts: List[str], batch_size: int, max_tokens_per_batch: int) -> List[List[float]]:
+    """Embeds all texts through the API (see create_embeddings)."""
+    logger.info("Generating embeddings for %d text chunks using model '%s'.", len(texts), EMBEDDING_MODEL)
+
+    # Pack texts into batches by token count, so short chunks share a request instead of
+    # paying one round-trip per fixed-size group.
+    batches = _pack_batches(texts, batch_size, max_tokens_per_batch)
+    total_batches = len(batches)
+
+    # Send up to MAX_CONCURRENT_REQUESTS batches concurrently. This runs on threads with the
+    # shared sync client rather than an event loop, since callers include async endpoints whose
+    # loop is already running. map() yields results in batch order, so embeddings stay aligned
+    # with their texts; the first failing batch re-raises here.
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REQUESTS, total_batches)) as executor:
+        batch_results = executor.map(_embed_batch, batches, range(1, total_batches + 1), [total_batches] * total_batches)
+        all_embeddings = [embedding for batch_embeddings in batch_results for embedding in batch_embeddings]
+
+    logger.info("Completed generating %d embeddings in %d batches.", len(all_embeddings), total_batches)
     return all_embeddings
 
-def get_embedding_for_query(query: str) -> List[float]:
+def get_embedding_for_query(query: str, use_cache: bool = False) -> List[float]:
     """
     Generates an embedding for a single query text string using the OpenAI API.
     This is typically used for generating the embedding of a user's search query 
     to compare against document embeddings.
+    With use_cache, the local embedding cache is checked first and fresh embeddings are added to it.
     """
     # Validate that the query string is not empty or just whitespace.
     if not query.strip():
-        print("Query string is empty or whitespace. Cannot generate embedding.")
+        logger.warning("Query string is empty or whitespace. Cannot generate embedding.")
         return [] # Return empty list for an empty query.
 
+    if use_cache:
+        try:
+            cached = get_cached_embeddings([query], EMBEDDING_MODEL)[0]
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache unavailable for query: %s", e)
+            cached = None
+        if cached is not None:
+            return cached
+        embedding = get_embedding_for_query(query)
+        if embedding:
+            try:
+                cache_embeddings([query], [embedding], EMBEDDING_MODEL)
+            except sqlite3.Error as e:
+                logger.warning("Could not write query embedding to the cache: %s", e)
+        return embedding
+
     try:
-        print(f"Generating embedding for query: '{query[:100]}...'") # Log a snippet of the query for context.
+        logger.debug("Generating embedding for query: '%s...'", query[:100]) # Log a snippet of the query for context.
         
         # Call the OpenAI API to create an embedding for the single query string.
         response = client.embeddings.create(
@@ -92,11 +223,24 @@ def get_embedding_for_query(query: str) -> List[float]:
         if response.data and len(response.data) > 0:
             return response.data[0].embedding
         else:
-            print("OpenAI API returned no data for the query embedding.")
+            logger.warning("OpenAI API returned no data for the query embedding.")
             return [] # Should not happen with a valid query and API key
 
     except Exception as e:
         # Handle exceptions during the API call for the query embedding.
-        print(f"Error generating query embedding: {type(e).__name__} - {str(e)}")
+        logger.error("Error generating query embedding: %s - %s", type(e).__name__, e)
         # Propagate the exception for higher-level error handling.
-        raise # Re-raise to signal failure to the caller. 
\ No newline at end of file
+        raise # Re-raise to signal failure to the caller.
+
+def get_embeddings_for_queries(queries: List[str]) -> np.ndarray:
+    """
+    Generates embeddings for several query strings at once and returns them as an (N, d) float32 array,
+    one row per query. The queries are sent in as few embedding requests as possible (see create_embeddings),
+    and queries embedded before are served from the local embedding cache.
+    """
+    if not queries:
+        return np.empty((0, 0), dtype=np.float32)
+    embeddings = create_embeddings(queries)
+    if len(embeddings) != len(queries):
+        raise RuntimeError(f"Expected {len(queries)} query embeddings, got {len(embeddings)}.")
+    return np.asarray(embeddings, dtype=np.float32)
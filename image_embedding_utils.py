@@ -1,27 +1,208 @@
 from sentence_transformers import SentenceTransformer
+import torch
+import numpy as np
 from PIL import Image
 import requests
+from requests.adapters import HTTPAdapter
 from io import BytesIO
+import hashlib
 import os
-from typing import List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from diskcache import Cache
 
 # Load a pre-trained CLIP model
 # You can choose other models from sentence-transformers that are suitable for image embeddings.
 # 'clip-ViT-B-32' is a common choice.
 IMAGE_EMBEDDING_MODEL = None
+IMAGE_EMBEDDING_MODEL_NAME = 'clip-ViT-B-32'
+
+# Number of images encoded per forward pass in get_image_embeddings.
+# Raise it on GPUs with more memory; sentence-transformers still keeps its internal
+# length-sorted batching and restores the original input order on return.
+IMAGE_EMBEDDING_BATCH_SIZE = 32
+# On CPU-only machines, batches larger than this are spread over several worker processes.
+MULTI_PROCESS_MIN_IMAGES = 2000
+# Number of images fetched/decoded concurrently before a batched encode. Loading is mostly
+# network I/O (URL downloads), so threads overlap the round-trips; symbol images are small,
+# so latency rather than bandwidth limits throughput and a wide pool pays off.
+IMAGE_LOAD_WORKERS = int(os.getenv("IMAGE_LOAD_WORKERS", "32"))
+# Downloaded images are kept here, keyed by URL, together with their ETag/Last-Modified headers.
+# Within IMAGE_CACHE_MAX_AGE_SECONDS a cached image is used without a request; after that it is
+# revalidated with a conditional GET, so an unchanged image costs a 304 instead of a download and a
+# changed one is picked up. The least recently stored entries are evicted beyond IMAGE_CACHE_SIZE_LIMIT bytes.
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", ".image_cache")
+IMAGE_CACHE_MAX_AGE_SECONDS = int(os.getenv("IMAGE_CACHE_MAX_AGE_SECONDS", str(24 * 60 * 60)))
+IMAGE_CACHE_SIZE_LIMIT = int(os.getenv("IMAGE_CACHE_SIZE_LIMIT", str(1 << 30))) # 1 GiB
+image_cache = Cache(IMAGE_CACHE_DIR, size_limit=IMAGE_CACHE_SIZE_LIMIT)
+# Image embeddings (from get_image_embedding and get_image_embeddings), keyed by a hash of the image contents (and the model),
+# so re-ingesting known images, or the same image under another URL, skips the model entirely.
+# Vectors are stored as float32, the precision the model produces.
+IMAGE_EMBEDDING_CACHE_DIR = os.getenv("IMAGE_EMBEDDING_CACHE_DIR", ".image_embedding_cache")
+image_embedding_cache = Cache(IMAGE_EMBEDDING_CACHE_DIR)
+
+# Browser-like headers; some image hosts reject the default requests User-Agent.
+IMAGE_REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+}
+
+def _create_session() -> requests.Session:
+    """Creates the shared download session; its keep-alive pool is sized for the loader threads."""
+    session = requests.Session()
+    session.headers.update(IMAGE_REQUEST_HEADERS)
+    adapter = HTTPAdapter(pool_connections=IMAGE_LOAD_WORKERS, pool_maxsize=IMAGE_LOAD_WORKERS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# One session per process, so repeated downloads from the same host reuse open TLS connections.
+HTTP_SESSION = _create_session()
+
+def _select_device() -> str:
+    """Returns the fastest available torch device: CUDA, then Apple MPS, then CPU."""
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
 
 def _initialize_model():
     global IMAGE_EMBEDDING_MODEL
     if IMAGE_EMBEDDING_MODEL is None:
         try:
-            print("Initializing image embedding model (this may take a moment on first run)...")
-            IMAGE_EMBEDDING_MODEL = SentenceTransformer('clip-ViT-B-32')
+            device = _select_device()
+            print(f"Initializing image embedding model on '{device}' (this may take a moment on first run)...")
+            # The model stays in fp32: the CLIP image processor emits fp32 pixel values,
+            # which a .half() model would reject.
+            IMAGE_EMBEDDING_MODEL = SentenceTransformer(IMAGE_EMBEDDING_MODEL_NAME, device=device)
+            IMAGE_EMBEDDING_MODEL.eval() # Inference only: disables dropout and other training-mode behaviour.
             print("Image embedding model initialized successfully.")
         except Exception as e:
             print(f"Error initializing SentenceTransformer model: {e}")
             # Potentially re-raise or handle as a critical failure
             raise
 
+def _fetch_image_bytes(url: str) -> bytes:
+    """
+    Returns the raw bytes of an image URL, using the on-disk cache (see IMAGE_CACHE_DIR) when possible.
+
+    Args:
+        url (str): The public URL of the image.
+
+    Returns:
+        bytes: The downloaded (or cached) image file contents.
+    """
+    entry = image_cache.get(url)
+    if entry is not None and time.time() - entry['fetched_at'] < IMAGE_CACHE_MAX_AGE_SECONDS:
+        return entry['content']
+
+    # Revalidate a stale entry: the server answers 304 Not Modified if the image hasn't changed.
+    conditional_headers = {}
+    if entry is not None:
+        if entry['etag']:
+            conditional_headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            conditional_headers['If-Modified-Since'] = entry['last_modified']
+
+    response = HTTP_SESSION.get(url, headers=conditional_headers, timeout=15)
+    if response.status_code == 304 and entry is not None:
+        entry['fetched_at'] = time.time()
+    else:
+        response.raise_for_status() # Raise an exception for bad status codes
+        entry = {
+            'content': response.content,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        }
+
+    try:
+        image_cache.set(url, entry)
+    except Exception as e:
+        print(f"Could not cache image downloaded from {url}: {e}")
+    return entry['content']
+
+def _read_image_bytes(image_path_or_url: str) -> Optional[bytes]:
+    """
+    Reads the raw contents of an image from a local path or a publicly accessible URL.
+
+    Args:
+        image_path_or_url (str): Local path to the image or its public URL.
+
+    Returns:
+        Optional[bytes]: The image file contents, or None if they could not be read.
+    """
+    if image_path_or_url.startswith(("http://", "https://")):
+        try:
+            return _fetch_image_bytes(image_path_or_url)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching image from URL {image_path_or_url}: {e}")
+            return None
+    elif os.path.exists(image_path_or_url):
+        try:
+            with open(image_path_or_url, 'rb') as f:
+                return f.read()
+        except OSError as e:
+            print(f"Error reading local image {image_path_or_url} (possibly missing or permissions): {e}")
+            return None
+    else:
+        print(f"Error: Image path does not exist and is not a valid URL: {image_path_or_url}")
+        return None
+
+def _open_image(content: bytes, image_path_or_url: str) -> Optional[Image.Image]:
+    """Decodes image bytes read by _read_image_bytes; returns None if they are not a valid image."""
+    # Successes are not reported per image; a batch over thousands of symbols would print a line for each.
+    try:
+        return Image.open(BytesIO(content))
+    except IOError as e:
+        print(f"Error opening image {image_path_or_url} (possibly invalid image format): {e}")
+        return None
+
+def _load_image(image_path_or_url: str) -> Optional[Image.Image]:
+    """
+    Loads a single image from a local path or a publicly accessible URL.
+
+    Args:
+        image_path_or_url (str): Local path to the image or its public URL.
+
+    Returns:
+        Optional[Image.Image]: The loaded PIL image, or None if it could not be loaded.
+    """
+    content = _read_image_bytes(image_path_or_url)
+    return _open_image(content, image_path_or_url) if content is not None else None
+
+def _embedding_cache_key(content: bytes) -> str:
+    """Cache key of an image embedding: the model name plus a SHA-256 of the image contents."""
+    return f"{IMAGE_EMBEDDING_MODEL_NAME}:{hashlib.sha256(content).hexdigest()}"
+
+def _get_cached_embedding(key: str) -> Optional[List[float]]:
+    """Returns the cached embedding for a cache key, or None if it isn't cached (or the cache is unavailable)."""
+    try:
+        cached = image_embedding_cache.get(key)
+    except Exception as e:
+        print(f"Image embedding cache unavailable: {e}")
+        return None
+    return np.frombuffer(cached, dtype=np.float32).tolist() if cached is not None else None
+
+def _cache_embedding(key: str, embedding: np.ndarray):
+    """Stores an embedding under a cache key as raw float32 bytes."""
+    try:
+        image_embedding_cache.set(key, np.asarray(embedding, dtype=np.float32).tobytes())
+    except Exception as e:
+        print(f"Could not write image embedding to the cache: {e}")
+
+def preload_model():
+    """
+    Loads the image embedding model up front so the first request does not pay the load cost.
+    Long-lived processes (e.g. the FastAPI server) call this once at startup.
+    """
+    _initialize_model()
+
 def get_image_embedding(image_path_or_url: str) -> List[float]:
     """
     Generates an embedding for a single image using a pre-trained model.
@@ -33,55 +214,36 @@ def get_image_embedding(image_path_or_url: str) -> List[float]:
     Returns:
         List[float]: The embedding vector for the image, or None if an error occurs.
     """
+    # An image embedded before (by contents, e.g. the same photo described again) skips the model.
+    content = _read_image_bytes(image_path_or_url)
+    if content is None:
+        # _read_image_bytes has already reported why the image could not be read.
+        print(f"Could not load image for embedding: {image_path_or_url}")
+        return None
+    cache_key = _embedding_cache_key(content)
+    cached = _get_cached_embedding(cache_key)
+    if cached is not None:
+        return cached
+
     _initialize_model() # Ensure model is loaded
     if IMAGE_EMBEDDING_MODEL is None:
         print("Image embedding model is not available.")
         return None
 
     try:
-        img_pil = None
-        if image_path_or_url.startswith(("http://", "https://")):
-            try:
-                # Define common browser-like headers
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    'Accept': 'image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'Connection': 'keep-alive',
-                }
-                response = requests.get(image_path_or_url, headers=headers, timeout=15) # Added headers and increased timeout slightly
-                response.raise_for_status() # Raise an exception for bad status codes
-                img_pil = Image.open(BytesIO(response.content))
-                print(f"Successfully loaded image from URL: {image_path_or_url}")
-            except requests.exceptions.RequestException as e:
-                print(f"Error fetching image from URL {image_path_or_url}: {e}")
-                return None
-            except IOError as e:
-                print(f"Error opening image from URL {image_path_or_url} (possibly invalid image format): {e}")
-                return None
-        elif os.path.exists(image_path_or_url):
-            try:
-                img_pil = Image.open(image_path_or_url)
-                print(f"Successfully loaded image from local path: {image_path_or_url}")
-            except FileNotFoundError:
-                print(f"Error: Image file not found at local path: {image_path_or_url}")
-                return None
-            except IOError as e:
-                print(f"Error opening local image {image_path_or_url} (possibly invalid image format or permissions): {e}")
-                return None
-        else:
-            print(f"Error: Image path does not exist and is not a valid URL: {image_path_or_url}")
-            return None
+        img_pil = _open_image(content, image_path_or_url)
         
         if img_pil:
             # Generate embedding
             # The encode method of SentenceTransformer for images typically expects a PIL Image object.
-            embedding = IMAGE_EMBEDDING_MODEL.encode(img_pil, convert_to_tensor=False).tolist()
+            # inference_mode skips autograd bookkeeping (version counters, view tracking) entirely.
+            with torch.inference_mode():
+                embedding = IMAGE_EMBEDDING_MODEL.encode(img_pil, convert_to_tensor=False, normalize_embeddings=True)
+            _cache_embedding(cache_key, embedding)
             print(f"Generated embedding for image: {image_path_or_url}")
-            return embedding
+            return embedding.tolist()
         else:
-            # This case should ideally be caught by earlier checks, but as a fallback:
+            # _load_image has already reported why the image could not be loaded.
             print(f"Could not load image for embedding: {image_path_or_url}")
             return None
 
@@ -90,6 +252,103 @@ def get_image_embedding(image_path_or_url: str) -> List[float]:
         # Depending on the severity, you might want to return None or re-raise
         return None
 
+def _encode_multi_process(images: List[Image.Image], batch_size: int):
+    """
+    Encodes images across several CPU worker processes using sentence-transformers' multi-process pool.
+    Uses half of the logical cores to avoid hyper-thread contention; the pool is stopped afterwards.
+    """
+    num_workers = max(1, (os.cpu_count() or 2) // 2)
+    print(f"Encoding {len(images)} images with {num_workers} CPU worker processes...")
+    pool = IMAGE_EMBEDDING_MODEL.start_multi_process_pool(["cpu"] * num_workers)
+    try:
+        embeddings = IMAGE_EMBEDDING_MODEL.encode_multi_process(images, pool, batch_size=batch_size)
+    finally:
+        IMAGE_EMBEDDING_MODEL.stop_multi_process_pool(pool)
+    # encode_multi_process has no normalize option; L2-normalize the rows here instead.
+    return embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+def get_image_embeddings(image_paths_or_urls: List[str], batch_size: int = IMAGE_EMBEDDING_BATCH_SIZE) -> List[Optional[List[float]]]:
+    """
+    Generates embeddings for many images with a single batched model call.
+    Encoding the images together amortizes the per-call model dispatch overhead
+    that get_image_embedding pays for every image.
+
+    Args:
+        image_paths_or_urls (List[str]): Local paths or public URLs of the images.
+        batch_size (int): Number of images encoded per forward pass.
+
+    Returns:
+        List[Optional[List[float]]]: One embedding per input, in input order. Entries are
+                                     None for images that could not be loaded or embedded.
+    """
+    if not image_paths_or_urls:
+        return []
+
+    # Read all image files concurrently; map() keeps them in input order.
+    with ThreadPoolExecutor(max_workers=min(IMAGE_LOAD_WORKERS, len(image_paths_or_urls))) as executor:
+        contents = list(executor.map(_read_image_bytes, image_paths_or_urls))
+    results: List[Optional[List[float]]] = [None] * len(image_paths_or_urls)
+
+    # Group inputs by image contents: cached images skip the model, and identical images
+    # (e.g. the same icon under several URLs) are decoded and encoded once.
+    positions_by_key: Dict[str, List[int]] = {}
+    for i, content in enumerate(contents):
+        if content is not None:
+            positions_by_key.setdefault(_embedding_cache_key(content), []).append(i)
+    cached_count = 0
+    keys_to_encode = []
+    for key, positions in positions_by_key.items():
+        embedding = _get_cached_embedding(key)
+        if embedding is None:
+            keys_to_encode.append(key)
+            continue
+        for position in positions:
+            results[position] = embedding
+        cached_count += len(positions)
+
+    # Only the successfully decoded images are encoded; remember which content key each came from.
+    images = {key: _open_image(contents[positions_by_key[key][0]], image_paths_or_urls[positions_by_key[key][0]])
+              for key in keys_to_encode}
+    loaded_keys = [key for key in keys_to_encode if images[key] is not None]
+    if not loaded_keys:
+        if cached_count:
+            print(f"All {cached_count} loaded images were served from the image embedding cache.")
+        else:
+            print("None of the images could be loaded for embedding.")
+        return results
+
+    # The model is only loaded when something is left to encode, so a fully cached batch never needs it.
+    _initialize_model() # Ensure model is loaded
+    if IMAGE_EMBEDDING_MODEL is None:
+        print("Image embedding model is not available.")
+        return results
+
+    images_to_encode = [images[key] for key in loaded_keys]
+    try:
+        if len(images_to_encode) > MULTI_PROCESS_MIN_IMAGES and IMAGE_EMBEDDING_MODEL.device.type == "cpu":
+            embeddings = _encode_multi_process(images_to_encode, batch_size)
+        else:
+            with torch.inference_mode():
+                embeddings = IMAGE_EMBEDDING_MODEL.encode(
+                    images_to_encode,
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False
+                )
+    except Exception as e:
+        print(f"An unexpected error occurred while generating batched image embeddings: {e}")
+        return results
+
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    for key, embedding in zip(loaded_keys, embeddings):
+        _cache_embedding(key, embedding)
+        embedding_list = embedding.tolist()
+        for position in positions_by_key[key]:
+            results[position] = embedding_list
+    print(f"Generated {len(loaded_keys)} image embeddings ({cached_count} cached) for {len(image_paths_or_urls)} inputs.")
+    return results
+
 if __name__ == '__main__':
     print("\n--- Running image_embedding_utils.py example ---")
     
@@ -1,26 +1,119 @@
-import csv
+import json
+import logging
 import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
 # from embedding_pipeline import get_embedding_for_text_chunks # No longer needed directly here
 from chroma_store import store_embeddings # We'll need to adapt/confirm this
 from embeddings import create_embeddings # Use this for batch embedding
-from image_embedding_utils import get_image_embedding # Import for image embeddings
+from image_embedding_utils import get_image_embeddings # Import for batched image embeddings
+
+# tqdm shows a progress bar while batches are stored; without it, ingestion just runs without one.
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
 
 # Define the path to your CSV file
 CSV_FILE_PATH = os.path.join("dashboard_symbols", "toyota_dashboard_symbols.csv")
 # Define a collection name for symbols in ChromaDB
 CHROMA_COLLECTION_NAME = "dashboard_symbols"
 IMAGE_EMBEDDINGS_COLLECTION_NAME = "symbol_image_embeddings"
+# Records per Chroma upsert; bounds the memory of each write while keeping round-trips few.
+CHROMA_BATCH = 2000
+# IDs already stored in ChromaDB by earlier runs, so a re-run after a crash only embeds what is missing.
+# Delete this file to force a full re-ingest (e.g. after resetting the ChromaDB directory).
+INGEST_STATE_PATH = os.getenv("INGEST_STATE_PATH", "ingest_state.json")
+# Rows per unit of work when building the embedding texts and metadata. Process workers are only
+# started for very large CSVs (ROWS_PER_PREP_WORKER rows per worker); below that, pickling the rows
+# to and from the workers costs more than building the strings and dicts in-process.
+PREP_CHUNK_ROWS = 500
+ROWS_PER_PREP_WORKER = 50_000
+# Symbol name -> ID suffix in one pass: spaces become underscores, parentheses and dots are dropped.
+_ID_TABLE = str.maketrans({' ': '_', '(': None, ')': None, '.': None})
+
+# Progress is logged at INFO; per-row messages go to DEBUG, so a large CSV doesn't write a line per row.
+logger = logging.getLogger(__name__)
+
+
+def _load_done_ids() -> set:
+    """Returns the IDs stored by earlier runs (empty if there is no state file yet)."""
+    if not os.path.exists(INGEST_STATE_PATH):
+        return set()
+    with open(INGEST_STATE_PATH, encoding='utf-8') as f:
+        return set(json.load(f))
+
+
+def _save_done_ids(done: set):
+    """Persists the stored IDs. Written to a temp file first, so a crash never leaves a truncated state file."""
+    tmp_path = f"{INGEST_STATE_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(sorted(done), f)
+    os.replace(tmp_path, INGEST_STATE_PATH)
+
+
+def _store_with_checkpoints(texts, embeddings, ids, metadata, collection_name, done: set) -> int:
+    """Stores the records in CHROMA_BATCH slices, adding each slice's IDs to `done` (and
+    saving it) once the slice is written. Returns the number of records stored.
+    """
+    starts = range(0, len(ids), CHROMA_BATCH)
+    if tqdm is not None:
+        starts = tqdm(starts, desc=f"Storing in '{collection_name}'", unit="batch")
+    for start in starts:
+        end = start + CHROMA_BATCH
+        store_embeddings(
+            texts=texts[start:end],
+            embeddings=embeddings[start:end],
+            ids=ids[start:end],
+            collection_name=collection_name,
+            metadata=metadata[start:end],
+            batch_size=CHROMA_BATCH
+        )
+        done.update(ids[start:end])
+        _save_done_ids(done)
+    return len(ids)
+
+
+def _prep_chunk(rows: List[Tuple[str, str, str, str]]) -> Tuple[List[str], List[Dict]]:
+    """Builds the embedding text and metadata of each (unique_id, symbol_name, image_url, meaning) row."""
+    # Combine name and meaning for a richer embedding context
+    texts = [f"Symbol: {symbol_name}. Meaning: {meaning}" for _, symbol_name, _, meaning in rows]
+    metadata = [{
+        "id": unique_id, # Store the unique ID in metadata as well for reference
+        "symbol_name": symbol_name,
+        "image_url": image_url,
+        "original_meaning": meaning, # Store original meaning separately if needed
+        "source": "toyota_dashboard_symbols_csv"
+    } for unique_id, symbol_name, image_url, meaning in rows]
+    return texts, metadata
+
+
+def _prep_rows(rows: List[Tuple[str, str, str, str]]) -> Tuple[List[str], List[Dict]]:
+    """Runs _prep_chunk over the rows in PREP_CHUNK_ROWS chunks, across processes for very large CSVs.
+    Results keep the row order.
+    """
+    num_workers = min(os.cpu_count() or 1, len(rows) // ROWS_PER_PREP_WORKER)
+    if num_workers <= 1:
+        return _prep_chunk(rows)
+
+    chunks = [rows[start:start + PREP_CHUNK_ROWS] for start in range(0, len(rows), PREP_CHUNK_ROWS)]
+    texts, metadata = [], []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        # chunksize groups several chunks per task, so workers aren't round-tripping 500 rows at a time.
+        for chunk_texts, chunk_metadata in executor.map(_prep_chunk, chunks, chunksize=8):
+            texts.extend(chunk_texts)
+            metadata.extend(chunk_metadata)
+    return texts, metadata
 
 
 def process_and_embed_symbols():
     """
     Reads symbol data from the CSV, creates combined text for embedding,
     generates embeddings, and stores them in ChromaDB.
+    Symbols stored by a previous run (see INGEST_STATE_PATH) are skipped.
     """
-    print(f"Starting symbol ingestion from {CSV_FILE_PATH}...")
-    symbols_to_embed = []
-    all_texts = []
-    all_metadata = []
+    logger.info("Starting symbol ingestion from %s...", CSV_FILE_PATH)
 
     # For storing image embeddings and their metadata
     all_image_embeddings = []
@@ -28,139 +121,161 @@ def process_and_embed_symbols():
     all_image_ids = [] # Separate IDs for image embeddings, linked to symbol if needed
 
     if not os.path.exists(CSV_FILE_PATH):
-        print(f"Error: CSV file not found at {CSV_FILE_PATH}")
+        logger.error("CSV file not found at %s", CSV_FILE_PATH)
         return
 
-    with open(CSV_FILE_PATH, mode='r', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for i, row in enumerate(reader):
-            symbol_name = row.get("symbol_name", "").strip()
-            image_url = row.get("image_url", "").strip()
-            meaning = row.get("meaning", "").strip()
-
-            if not symbol_name or not meaning:
-                print(f"Skipping row {i+1} due to missing symbol_name or meaning.")
-                continue
-
-            # Combine name and meaning for a richer embedding context
-            combined_text = f"Symbol: {symbol_name}. Meaning: {meaning}"
-            
-            # The ID for ChromaDB should be unique
-            # Using image_url as a base for ID, but ensure it's a valid Chroma ID (no special chars, etc.)
-            # A safer bet might be a processed symbol_name + index or a UUID
-            unique_id = f"symbol_{i}_{symbol_name.replace(' ', '_').lower().replace('(','').replace(')','').replace('.','')}"
-
-            all_texts.append(combined_text)
-            all_metadata.append({
-                "id": unique_id, # Store the unique ID in metadata as well for reference
-                "symbol_name": symbol_name,
-                "image_url": image_url,
-                "original_meaning": meaning, # Store original meaning separately if needed
-                "source": "toyota_dashboard_symbols_csv"
-            })
-
-            # Now, attempt to get image embedding for the symbol's image_url
-            if image_url:
-                print(f"Processing image for symbol '{symbol_name}' from {image_url}")
-                img_embedding = get_image_embedding(image_url)
-                if img_embedding:
-                    all_image_embeddings.append(img_embedding)
-                    # ID for image embedding can be related to the text unique_id or be the same if 1-to-1
-                    image_unique_id = f"img_{unique_id}" 
-                    all_image_ids.append(image_unique_id)
-                    all_image_metadata.append({
-                        "id": image_unique_id, # Storing the ID itself in metadata for reference
-                        "symbol_id": unique_id, # Link back to the text symbol ID
-                        "symbol_name": symbol_name,
-                        "image_url": image_url,
-                        "original_meaning": meaning, # Add the original meaning here
-                        "source": "toyota_dashboard_symbols_csv_image"
-                    })
-                else:
-                    print(f"Could not generate embedding for image: {image_url} for symbol '{symbol_name}'")
+    # Read the three columns in one pass. Every value is kept as a string (no NaN or number
+    # inference), so names like "N/A" survive exactly as the csv module would read them.
+    df = pd.read_csv(CSV_FILE_PATH, usecols=["symbol_name", "image_url", "meaning"],
+                     dtype=str, keep_default_na=False, encoding='utf-8').fillna("")
+    for column in ("symbol_name", "image_url", "meaning"):
+        df[column] = df[column].str.strip()
+
+    # The row index is part of each symbol's ID, so it is taken before dropping incomplete rows.
+    valid = (df["symbol_name"] != "") & (df["meaning"] != "")
+    for i in df.index[~valid]:
+        logger.debug("Skipping row %d due to missing symbol_name or meaning.", i + 1)
+    df = df[valid]
+
+    # The ID for ChromaDB should be unique
+    # Using image_url as a base for ID, but ensure it's a valid Chroma ID (no special chars, etc.)
+    # A safer bet might be a processed symbol_name + index or a UUID
+    unique_ids = [
+        f"symbol_{i}_{symbol_name.lower().translate(_ID_TABLE)}"
+        for i, symbol_name in zip(df.index, df["symbol_name"])
+    ]
+
+    rows = list(zip(unique_ids, df["symbol_name"], df["image_url"], df["meaning"]))
+    for _, symbol_name, image_url, _ in rows:
+        if not image_url:
+            logger.debug("No image_url for symbol '%s', skipping image embedding.", symbol_name)
+
+    # Skip what an earlier run already stored. Text and image records are tracked separately,
+    # so a run that died between the two stores only redoes the missing half.
+    done = _load_done_ids()
+    text_rows = [row for row in rows if row[0] not in done]
+    # Symbols with an image_url are embedded together in a later batched stage.
+    image_rows = [row for row in rows if row[2] and f"img_{row[0]}" not in done] # (unique_id, symbol_name, image_url, meaning)
+    if done:
+        logger.info("Resuming: %d symbols were already stored by a previous run.", len(rows) - len(text_rows))
+
+    all_texts, all_metadata = _prep_rows(text_rows)
+
+    # Embed every queued symbol image with a single batched model call.
+    if image_rows:
+        logger.info("Generating image embeddings for %d symbols...", len(image_rows))
+        img_embeddings = get_image_embeddings([row[2] for row in image_rows])
+        failed_images = 0
+        for (unique_id, symbol_name, image_url, meaning), img_embedding in zip(image_rows, img_embeddings):
+            if img_embedding:
+                all_image_embeddings.append(img_embedding)
+                # ID for image embedding can be related to the text unique_id or be the same if 1-to-1
+                image_unique_id = f"img_{unique_id}" 
+                all_image_ids.append(image_unique_id)
+                all_image_metadata.append({
+                    "id": image_unique_id, # Storing the ID itself in metadata for reference
+                    "symbol_id": unique_id, # Link back to the text symbol ID
+                    "symbol_name": symbol_name,
+                    "image_url": image_url,
+                    "original_meaning": meaning, # Add the original meaning here
+                    "source": "toyota_dashboard_symbols_csv_image"
+                })
             else:
-                print(f"No image_url for symbol '{symbol_name}', skipping image embedding.")
+                failed_images += 1
+                logger.debug("Could not generate embedding for image: %s for symbol '%s'", image_url, symbol_name)
+
+        if failed_images:
+            logger.warning("Could not generate embeddings for %d of %d images.", failed_images, len(image_rows))
 
-    if not all_texts:
-        print("No valid symbols found to process.")
+    if not rows:
+        logger.warning("No valid symbols found to process.")
         return
+    if not all_texts and not all_image_embeddings:
+        logger.info("All symbols are already stored; nothing to do.")
+        return
+
+    logger.info("Prepared %d symbols for embedding.", len(all_texts))
 
-    print(f"Prepared {len(all_texts)} symbols for embedding.")
+    # Embed each distinct text once (the same symbol text often appears in several rows) and
+    # fan the vectors back out to every row that uses it.
+    unique_text_index = {}
+    for text in all_texts:
+        unique_text_index.setdefault(text, len(unique_text_index))
+    logger.info("Embedding %d unique texts for %d symbols.", len(unique_text_index), len(all_texts))
 
-    # Use create_embeddings for batch processing
-    text_embeddings_list = create_embeddings(all_texts, batch_size=50) # Adjust batch_size if needed
+    # create_embeddings packs the texts into as few requests as the API's input and token limits allow
+    unique_embeddings = create_embeddings(list(unique_text_index)) if unique_text_index else []
+    if len(unique_embeddings) == len(unique_text_index):
+        text_embeddings_list = [unique_embeddings[unique_text_index[text]] for text in all_texts]
+    else:
+        text_embeddings_list = unique_embeddings # Length mismatch is reported below.
 
-    print(f"Generated {len(text_embeddings_list)} text embeddings.")
+    logger.info("Generated %d text embeddings.", len(text_embeddings_list))
 
     # Store text embeddings in ChromaDB
     # Your store_embeddings function will need to handle a list of texts, their embeddings, and metadata.
     # It might need adjustments to specify the collection name.
     # We need to ensure store_embeddings can handle this format and the specified collection.
     
-    if text_embeddings_list and len(text_embeddings_list) == len(all_texts):
-        # Placeholder for actual storage logic.
-        # We need to call a function like: 
-        # success = store_data_in_chroma(texts=all_texts, embeddings=text_embeddings_list, metadata=all_metadata, collection_name=CHROMA_COLLECTION_NAME)
-        # This function needs to exist in chroma_store.py or be created.
-        # print(f"Attempting to store {len(text_embeddings_list)} embeddings into ChromaDB collection '{CHROMA_COLLECTION_NAME}'.")
-        # print("Placeholder: Actual call to chroma_store.store_data_in_chroma would happen here.")
-        # For now, simulate success
-        # In a real scenario, you'd get a status from the store_embeddings function.
-        # print("Symbol ingestion process placeholder finished successfully (simulated storage).")
-
+    if len(text_embeddings_list) == len(all_texts):
         # Extract the list of IDs from the metadata we prepared
         text_ids_to_store = [meta["id"] for meta in all_metadata]
 
-        try:
-            print(f"Storing {len(text_embeddings_list)} text embeddings into ChromaDB collection '{CHROMA_COLLECTION_NAME}'.")
-            storage_result = store_embeddings(
-                texts=all_texts,
-                embeddings=text_embeddings_list, # Renamed for clarity
-                ids=text_ids_to_store, 
-                collection_name=CHROMA_COLLECTION_NAME,
-                metadata=all_metadata
-            )
-            print(f"Successfully stored {storage_result.get('stored_count')} text-based symbols in collection '{storage_result.get('collection_name')}'.")
-        except Exception as e:
-            print(f"Error storing text symbols in ChromaDB: {e}")
+        # Each stored batch is checkpointed, so an interrupted run resumes after the last written batch.
+        if text_ids_to_store:
+            try:
+                logger.info("Storing %d text embeddings into ChromaDB collection '%s'.", len(text_embeddings_list), CHROMA_COLLECTION_NAME)
+                stored_count = _store_with_checkpoints(
+                    all_texts,
+                    text_embeddings_list,
+                    text_ids_to_store,
+                    all_metadata,
+                    CHROMA_COLLECTION_NAME,
+                    done
+                )
+                logger.info("Successfully stored %d text-based symbols in collection '%s'.", stored_count, CHROMA_COLLECTION_NAME)
+            except Exception as e:
+                logger.error("Error storing text symbols in ChromaDB: %s", e)
 
         # Now store image embeddings if any were generated
         if all_image_embeddings and len(all_image_embeddings) == len(all_image_ids) == len(all_image_metadata):
             try:
-                print(f"Storing {len(all_image_embeddings)} image embeddings into ChromaDB collection '{IMAGE_EMBEDDINGS_COLLECTION_NAME}'.")
+                logger.info("Storing %d image embeddings into ChromaDB collection '%s'.", len(all_image_embeddings), IMAGE_EMBEDDINGS_COLLECTION_NAME)
                 # Note: store_embeddings expects 'texts' as an argument. For image embeddings, 
                 # we don't have a direct textual representation of the image itself being stored *as the document*.
                 # We can pass the image_url or symbol_name as the 'document' for reference if needed by store_embeddings.
                 # Let's use image_url as the 'document' for this collection for now.
                 image_documents_for_chroma = [meta['image_url'] for meta in all_image_metadata]
 
-                image_storage_result = store_embeddings(
-                    texts=image_documents_for_chroma, # Using image_url as the "document"
-                    embeddings=all_image_embeddings,
-                    ids=all_image_ids,
-                    collection_name=IMAGE_EMBEDDINGS_COLLECTION_NAME,
-                    metadata=all_image_metadata
+                image_stored_count = _store_with_checkpoints(
+                    image_documents_for_chroma, # Using image_url as the "document"
+                    all_image_embeddings,
+                    all_image_ids,
+                    all_image_metadata,
+                    IMAGE_EMBEDDINGS_COLLECTION_NAME,
+                    done
                 )
-                print(f"Successfully stored {image_storage_result.get('stored_count')} image embeddings in collection '{image_storage_result.get('collection_name')}'.")
+                logger.info("Successfully stored %d image embeddings in collection '%s'.", image_stored_count, IMAGE_EMBEDDINGS_COLLECTION_NAME)
             except Exception as e:
-                print(f"Error storing image embeddings in ChromaDB: {e}")
+                logger.error("Error storing image embeddings in ChromaDB: %s", e)
         else:
             if not all_image_embeddings:
-                print("No image embeddings were generated to store.")
+                logger.info("No image embeddings were generated to store.")
             else:
-                print("Mismatch in image embeddings, IDs, or metadata counts. Skipping image embedding storage.")
+                logger.error("Mismatch in image embeddings, IDs, or metadata counts. Skipping image embedding storage.")
         
-        print("Symbol ingestion process finished.") # Unified end message
+        logger.info("Symbol ingestion process finished.") # Unified end message
 
     else:
-        print("Error: Number of text embeddings does not match number of texts. Skipping text symbol storage.")
+        logger.error("Number of text embeddings does not match number of texts. Skipping text symbol storage.")
         # Also inform about image embeddings if relevant
         if not all_image_embeddings:
-            print("Additionally, no image embeddings were generated.")
+            logger.error("Additionally, no image embeddings were generated.")
 
 
 if __name__ == "__main__":
     # This allows running the script directly for ingestion
     # Ensure your OpenAI API key and ChromaDB client are configured/initialized
     # appropriately before calling this.
-    process_and_embed_symbols() 
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    process_and_embed_symbols() 
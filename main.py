@@ -2,9 +2,20 @@ import sys
 import multiprocessing
 import urllib.parse
 import logging
+import logging.handlers
+import queue
 import config
 import uuid
 import os
+import json
+import hashlib
+import shutil
+import asyncio
+import heapq
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from diskcache import Cache
 
 # Ensures that multiprocessing works correctly on macOS.
 if sys.platform == 'darwin':
@@ -15,26 +26,36 @@ logging.basicConfig(level=config.LOG_LEVEL, format=config.LOG_FORMAT)
 logger = logging.getLogger(__name__)
 if not os.path.exists(config.LOG_DIR):
     os.makedirs(config.LOG_DIR)
-file_handler = logging.FileHandler(os.path.join(config.LOG_DIR, 'app.log'))
+# The server runs several worker processes (uvicorn --workers 4 in the Docker image). Each writes and
+# rotates its own app.<pid>.log, since rotating one shared file from several processes would leave the
+# others writing to the renamed file. Records are handed to a queue and written by a listener
+# thread, so request handlers never wait on disk I/O for logging.
+file_handler = logging.handlers.RotatingFileHandler(
+    os.path.join(config.LOG_DIR, f'app.{os.getpid()}.log'), maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT
+)
 file_handler.setFormatter(logging.Formatter(config.LOG_FORMAT))
-logger.addHandler(file_handler)
+log_queue = queue.Queue(-1)
+log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+log_listener.start()
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
 
 # Suppress specific ChromaDB warnings about existing embedding IDs
 logging.getLogger('chromadb.segment.impl.vector.local_persistent_hnsw').setLevel(logging.ERROR)
 logging.getLogger('chromadb.segment.impl.metadata.sqlite').setLevel(logging.ERROR)
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Path as FastApiPath, Request
-from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Path as FastApiPath, Query, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from document_processor import process_pdf
-from embedding_pipeline import process_json_for_embeddings, get_pending_documents
-from embeddings import get_embedding_for_query, client as openai_client
+from document_processor import process_pdf_in_worker
+from embedding_pipeline import process_json_for_embeddings, get_pending_documents, BATCH_SIZE as CHROMA_INSERT_BATCH_SIZE
+from embeddings import get_embedding_for_query, create_embeddings, async_client as async_openai_client
 from chroma_store import search_similar, get_collection
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from vision_analyzer import get_image_description_from_gpt4v
-from image_embedding_utils import get_image_embedding
+from image_embedding_utils import get_image_embedding, preload_model as preload_image_embedding_model
 
 # Initialize FastAPI application
 app = FastAPI(title=config.APP_TITLE)
@@ -48,23 +69,244 @@ app.add_middleware(
     allow_headers=config.CORS_ALLOW_HEADERS,
 )
 
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that adds a Cache-Control header to every file it serves."""
+
+    def __init__(self, *args, cache_control: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = self.cache_control
+        return response
+
 # Create static directory if it doesn't exist
 os.makedirs(config.STATIC_DIR, exist_ok=True)
 
 # Mount the static files directory
-app.mount(f"/{config.STATIC_DIR}", StaticFiles(directory=config.STATIC_DIR), name="static")
+app.mount(f"/{config.STATIC_DIR}", CachedStaticFiles(directory=config.STATIC_DIR, cache_control=config.STATIC_CACHE_CONTROL), name="static")
 
 # Directory for storing uploaded images
 os.makedirs(config.UPLOADED_IMAGES_DIR, exist_ok=True)
 
 # Mount the uploaded images directory to be served statically
-app.mount(f"/{config.UPLOADED_IMAGES_DIR}", StaticFiles(directory=config.UPLOADED_IMAGES_DIR), name="uploaded_images")
-
-IMAGE_EMBEDDINGS_COLLECTION_NAME = "symbol_image_embeddings"
-SIMILARITY_THRESHOLD = 0.70
+app.mount(f"/{config.UPLOADED_IMAGES_DIR}", CachedStaticFiles(directory=config.UPLOADED_IMAGES_DIR, cache_control=config.UPLOADED_IMAGES_CACHE_CONTROL), name="uploaded_images")
+
+def normalize_query(query: str) -> str:
+    """Lower-cases a query and collapses its whitespace, so trivially different spellings share a cache entry."""
+    return " ".join(query.lower().split())
+
+# Per-worker LRU of query embeddings, keyed by the normalized query. The embedding itself is always
+# computed from the query as the user typed it, since case carries meaning in terms like "ABS" or "P0420".
+_query_embeddings: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+_query_embeddings_lock = threading.Lock() # Endpoints call in from several thread-pool threads.
+
+def _lookup_query_embedding(key: str) -> Optional[Tuple[float, ...]]:
+    with _query_embeddings_lock:
+        embedding = _query_embeddings.get(key)
+        if embedding is not None:
+            _query_embeddings.move_to_end(key)
+        return embedding
+
+def _remember_query_embedding(key: str, embedding: List[float]) -> Tuple[float, ...]:
+    embedding = tuple(embedding)
+    with _query_embeddings_lock:
+        _query_embeddings[key] = embedding
+        _query_embeddings.move_to_end(key)
+        while len(_query_embeddings) > config.QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embeddings.popitem(last=False)
+    return embedding
+
+def get_query_embedding(query: str) -> List[float]:
+    """Returns the embedding of a search query, memoized on its normalized form."""
+    key = normalize_query(query)
+    embedding = _lookup_query_embedding(key)
+    if embedding is None:
+        # Backed by the on-disk embedding cache (keyed by exact text), so repeated queries also skip the API after a restart.
+        fresh = get_embedding_for_query(query.strip(), use_cache=True)
+        if not fresh:
+            # Failures are not remembered; the next request tries again.
+            raise RuntimeError("The embeddings API returned no embedding for the query.")
+        embedding = _remember_query_embedding(key, fresh)
+    return list(embedding)
+
+def get_query_embeddings(queries: List[str]) -> List[List[float]]:
+    """Returns the embeddings of several search queries (see get_query_embedding), sending all
+    queries not memoized yet to the embeddings API in one request.
+    """
+    keys = [normalize_query(q) for q in queries]
+    embeddings = {key: _lookup_query_embedding(key) for key in keys}
+    # Each missing key is embedded once, from the first query spelled that way.
+    misses = {}
+    for key, query in zip(keys, queries):
+        if embeddings[key] is None:
+            misses.setdefault(key, query.strip())
+    if misses:
+        fresh = create_embeddings(list(misses.values()))
+        if len(fresh) != len(misses):
+            raise RuntimeError(f"Expected {len(misses)} query embeddings, got {len(fresh)}")
+        for key, embedding in zip(misses, fresh):
+            embeddings[key] = _remember_query_embedding(key, embedding)
+    return [list(embeddings[key]) for key in keys]
+
+# On-disk cache of generated answers, shared by all worker processes. The key includes a hash of
+# the retrieved context, so answers are regenerated as soon as the indexed documents change.
+answer_cache = Cache(config.ANSWER_CACHE_DIR)
+
+def _answer_cache_key(query: str, context: str, model: str) -> Tuple[str, str, str]:
+    return (normalize_query(query), hashlib.sha256(context.encode('utf-8')).hexdigest(), model)
+
+# diskcache reads and writes are blocking SQLite calls that may wait on another worker's lock,
+# so they run in the thread pool rather than on the event loop.
+async def _get_cached_answer(cache_key: Tuple[str, str, str]) -> Optional[str]:
+    return await run_in_threadpool(answer_cache.get, cache_key)
+
+async def _set_cached_answer(cache_key: Tuple[str, str, str], answer: str):
+    await run_in_threadpool(answer_cache.set, cache_key, answer, expire=config.ANSWER_CACHE_TTL_SECONDS)
+
+# Leading bytes of the accepted upload formats, checked before anything is written to disk.
+UPLOAD_SNIFF_SIZE = 1024
+PDF_SIGNATURE = b"%PDF-" # May follow a little leading junk, which PDF readers tolerate within the first 1 KiB.
+IMAGE_SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"GIF87a", b"GIF89a", b"BM")
+
+def read_upload_head(file: UploadFile) -> bytes:
+    """Returns the first UPLOAD_SNIFF_SIZE bytes of an upload, leaving the file positioned at its start."""
+    head = file.file.read(UPLOAD_SNIFF_SIZE)
+    file.file.seek(0)
+    return head
+
+def is_image_data(head: bytes) -> bool:
+    """Whether the leading bytes are those of a PNG, JPEG, GIF, BMP or WebP file."""
+    return head.startswith(IMAGE_SIGNATURES) or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")
+
+def _copy_upload(source, path: str):
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer, config.UPLOAD_CHUNK_SIZE)
+
+async def save_upload(file: UploadFile, path: str):
+    """Writes an uploaded file to disk in UPLOAD_CHUNK_SIZE pieces, so memory stays flat regardless of file size.
+    The copy runs in the thread pool, so a slow disk doesn't stall the event loop.
+    """
+    # The multipart body has already been received into file.file (a spooled temp file) at this point.
+    await run_in_threadpool(_copy_upload, file.file, path)
 
-# Define the fine-tuned model ID
-FINE_TUNED_MODEL = "ft:gpt-3.5-turbo-0125:ucla:car-llm:BXkG9H4N"
+def combine_search_results(result_lists: List[List[dict]], top_k: int) -> List[dict]:
+    """Merges the results of several collection searches into the top_k most similar, dropping duplicate passages.
+    Each list must be ordered by descending similarity, as search_similar returns them.
+    """
+    combined_results = []
+    seen_texts = set()
+    # Chroma already sorts each list, so a lazy merge yields the overall best first and can stop at top_k.
+    for res in heapq.merge(*result_lists, key=lambda x: -x['similarity']):
+        if top_k is not None and len(combined_results) >= top_k:
+            break
+        # Use text content as the key for deduplication to avoid showing identical passages;
+        # the first (most similar) copy is kept. str() handles a missing or None text.
+        text_key = str(res.get('text', ''))
+        if text_key in seen_texts:
+            continue
+        seen_texts.add(text_key)
+        combined_results.append(res)
+    return combined_results
+
+NO_ANSWER_MESSAGE = "No relevant information found to answer your query."
+
+def _answer_messages(query: str, context: str) -> List[dict]:
+    """Chat messages asking the fine-tuned model to answer a query from the retrieved context."""
+    return [
+        {"role": "system", "content": "You are a helpful assistant specializing in car manuals. Based on the provided context, give a comprehensive and detailed answer to the user\'s question. Explain the steps or information clearly."},
+        {"role": "user", "content": f"Context: {context}\n\nQuestion: {query}"}
+    ]
+
+def _sse(data: str, event: Optional[str] = None) -> str:
+    """Formats one server-sent event. The data is JSON-encoded, so newlines in answer text can't break the framing."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def stream_answer(query: str, context: str):
+    """Yields the answer to a query as server-sent events: one data event per generated piece of text,
+    then a "done" event (or an "error" event if generation fails). Complete answers are cached like /search's.
+    """
+    if not context:
+        yield _sse(NO_ANSWER_MESSAGE)
+        yield _sse("", event="done")
+        return
+
+    cache_key = _answer_cache_key(query, context, config.FINE_TUNED_MODEL_ID)
+    cached_answer = await _get_cached_answer(cache_key)
+    if cached_answer is not None:
+        logger.info(f"Using cached answer for streamed query: '{query}'")
+        yield _sse(cached_answer)
+        yield _sse("", event="done")
+        return
+
+    answer_parts = []
+    try:
+        logger.info(f"Streaming answer from fine-tuned model: {config.FINE_TUNED_MODEL_ID}")
+        stream = await async_openai_client.chat.completions.create(
+            model=config.FINE_TUNED_MODEL_ID,
+            messages=_answer_messages(query, context),
+            temperature=0.3,
+            max_tokens=450,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                answer_parts.append(chunk.choices[0].delta.content)
+                yield _sse(chunk.choices[0].delta.content)
+    except Exception as e_llm:
+        logger.error(f"Error streaming answer with fine-tuned model for query '{query}': {e_llm}", exc_info=True)
+        yield _sse(f"Error generating answer with LLM: {type(e_llm).__name__}", event="error")
+        return
+
+    answer = "".join(answer_parts)
+    if answer:
+        await _set_cached_answer(cache_key, answer)
+    yield _sse("", event="done")
+
+# Flush queued log records to this worker's log file before it exits.
+@app.on_event("shutdown")
+async def stop_log_listener():
+    log_listener.stop()
+
+# PDF parsing is CPU-bound, so uploaded PDFs are parsed in worker processes. The pool is shared by
+# all requests of this server worker, which bounds the number of parsing processes; each file is
+# parsed within a single pool process (max_workers=1), so large files don't start pools of their own.
+# The "spawn" start method avoids forking this multithreaded process. The pool is created in the
+# startup hook rather than at import, so spawned children re-importing this module don't build their own.
+@app.on_event("startup")
+async def start_pdf_processing_pool():
+    app.state.pdf_processing_pool = ProcessPoolExecutor(max_workers=config.PDF_PROCESSING_WORKERS,
+                                                        mp_context=multiprocessing.get_context("spawn"))
+
+@app.on_event("shutdown")
+async def stop_pdf_processing_pool():
+    app.state.pdf_processing_pool.shutdown(wait=False, cancel_futures=True)
+
+# Load heavy models once per worker process so individual requests don't pay the cold-start cost.
+@app.on_event("startup")
+async def preload_models():
+    if config.PRELOAD_IMAGE_EMBEDDING_MODEL:
+        logger.info("Preloading image embedding model.")
+        try:
+            preload_image_embedding_model()
+        except Exception as e:
+            # The model is loaded lazily on first use if preloading fails.
+            logger.error(f"Could not preload image embedding model: {e}", exc_info=True)
+
+# Resolve the Chroma client and collection handles once at startup and keep them in app.state,
+# so the first /search doesn't pay for opening the store and searches skip the lookup.
+app.state.collections = {}
+
+@app.on_event("startup")
+async def warm_collections():
+    for collection_name in (config.TEXT_EMBEDDINGS_COLLECTION, config.DASHBOARD_SYMBOLS_TEXT_COLLECTION, config.IMAGE_EMBEDDINGS_COLLECTION):
+        try:
+            app.state.collections[collection_name] = get_collection(collection_name)
+        except Exception as e:
+            # search_similar opens the collection by name if it isn't in app.state.collections.
+            logger.error(f"Could not open collection '{collection_name}': {e}", exc_info=True)
 
 # Pydantic model for individual PDF processing result
 class PDFProcessingResult(BaseModel):
@@ -88,6 +330,7 @@ class EmbeddingResponse(BaseModel):
     num_embeddings: int
     embedding_dimension: int
     message: str
+    batch_size: Optional[int] = None
 
 # Pydantic model for the search query.
 class SearchQuery(BaseModel):
@@ -95,6 +338,11 @@ class SearchQuery(BaseModel):
     top_k: Optional[int] = config.DEFAULT_SEARCH_TOP_K
     response_format: Optional[str] = None
 
+# Pydantic model for a batch of search queries.
+class BatchSearchQuery(BaseModel):
+    queries: List[str]
+    top_k: Optional[int] = config.DEFAULT_SEARCH_TOP_K
+
 # Pydantic model for image upload response
 class ImageUploadResponse(BaseModel):
     success: bool
@@ -122,55 +370,59 @@ async def process_pdf_endpoint(request: Request, files: List[UploadFile] = File(
     """
     Handles multiple PDF file uploads, saves the files, and processes them to extract text and metadata.
     """
-    results = []
     total_files = len(files)
     successful_files = 0
+    results: List[Optional[PDFProcessingResult]] = [None] * total_files
+
+    def failed(file: UploadFile, message: str) -> PDFProcessingResult:
+        return PDFProcessingResult(success=False, output_file="", metadata={}, message=message, original_filename=file.filename)
 
     try:
         # Create 'pdfs' directory if it doesn't exist
         os.makedirs(config.PDF_UPLOAD_DIR, exist_ok=True)
         
-        for file in files:
+        # Save the uploads one after another (they arrive over the same connection anyway) ...
+        saved = [] # (position, file, file_path) of every PDF written to disk
+        for i, file in enumerate(files):
             try:
                 # Validate file type
                 if not file.filename.lower().endswith('.pdf'):
-                    results.append(PDFProcessingResult(
-                        success=False,
-                        output_file="",
-                        metadata={},
-                        message="Not a PDF file",
-                        original_filename=file.filename
-                    ))
+                    results[i] = failed(file, "Not a PDF file")
+                    continue
+                # A renamed or corrupt file is rejected before it is written to disk and parsed.
+                if PDF_SIGNATURE not in read_upload_head(file):
+                    logger.warning(f"PDF upload '{file.filename}' does not contain PDF data.")
+                    results[i] = failed(file, "Not a valid PDF file")
                     continue
 
                 # Save uploaded file
                 file_path = os.path.join(config.PDF_UPLOAD_DIR, file.filename)
-                with open(file_path, "wb") as buffer:
-                    content = await file.read()
-                    buffer.write(content)
+                await save_upload(file, file_path)
                 logger.info(f"PDF file '{file.filename}' saved to '{file_path}'")
-
-                # Process the PDF
-                result = process_pdf(file_path)
-                successful_files += 1
-                
-                results.append(PDFProcessingResult(
-                    success=True,
-                    output_file=result["output_file"],
-                    metadata=result.get("metadata", {}),
-                    message="Successfully processed",
-                    original_filename=file.filename
-                ))
+                saved.append((i, file, file_path))
 
             except Exception as e:
-                logger.error(f"Error processing PDF '{file.filename}': {e}", exc_info=True)
-                results.append(PDFProcessingResult(
-                    success=False,
-                    output_file="",
-                    metadata={},
-                    message="Processing failed",
-                    original_filename=file.filename
-                ))
+                logger.error(f"Error saving PDF '{file.filename}': {e}", exc_info=True)
+                results[i] = failed(file, "Processing failed")
+
+        # ... then parse them in parallel in the shared process pool; files beyond its size wait their turn.
+        loop = asyncio.get_running_loop()
+        # return_exceptions: one bad PDF fails only its own entry, not the whole batch.
+        outcomes = await asyncio.gather(*(loop.run_in_executor(app.state.pdf_processing_pool, process_pdf_in_worker, file_path)
+                                          for _, _, file_path in saved), return_exceptions=True)
+        for (i, file, _), outcome in zip(saved, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Error processing PDF '{file.filename}': {outcome}", exc_info=outcome)
+                results[i] = failed(file, "Processing failed")
+                continue
+            successful_files += 1
+            results[i] = PDFProcessingResult(
+                success=True,
+                output_file=outcome["output_file"],
+                metadata=outcome.get("metadata", {}),
+                message="Successfully processed",
+                original_filename=file.filename
+            )
 
         overall_success = successful_files > 0
         overall_message = f"Successfully processed {successful_files} out of {total_files} PDF(s)"
@@ -185,12 +437,45 @@ async def process_pdf_endpoint(request: Request, files: List[UploadFile] = File(
         logger.error(f"Error in bulk PDF processing: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred while processing PDFs: {type(e).__name__}")
 
+# Background embedding jobs record their status in one JSON file per job, so any worker
+# process can answer /jobs/{job_id} regardless of which one accepted the job.
+def _job_status_path(job_id: str) -> str:
+    return os.path.join(config.EMBEDDING_JOBS_DIR, f"{job_id}.json")
+
+def _write_job_status(job_id: str, status: dict):
+    os.makedirs(config.EMBEDDING_JOBS_DIR, exist_ok=True)
+    path = _job_status_path(job_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path) # Readers never see a half-written status file.
+
+def _run_embedding_job(job_id: str, json_file: str, json_path: str, batch_size: int):
+    """Runs process_json_for_embeddings for a background job, recording its progress and result."""
+    _write_job_status(job_id, {"job_id": job_id, "json_file": json_file, "status": "running"})
+    try:
+        result = process_json_for_embeddings(json_path, collection_name=config.TEXT_EMBEDDINGS_COLLECTION, batch_size=batch_size)
+        status = "failed" if result.get("error") else "completed"
+        _write_job_status(job_id, {"job_id": job_id, "json_file": json_file, "status": status, "result": result})
+        logger.info(f"Background embedding job {job_id} for '{json_file}' {status}.")
+    except Exception as e:
+        logger.error(f"Background embedding job {job_id} for '{json_file}' failed: {e}", exc_info=True)
+        _write_job_status(job_id, {"job_id": job_id, "json_file": json_file, "status": "failed", "error": type(e).__name__})
+
 # Endpoint to generate embeddings for a processed JSON file.
 @app.post("/generate-embeddings/{json_file}", response_model=EmbeddingResponse)
-async def generate_embeddings_endpoint(json_file: str):
+async def generate_embeddings_endpoint(
+    json_file: str,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+    batch_size: int = Query(CHROMA_INSERT_BATCH_SIZE, ge=1, le=5000, description="Chunks written to ChromaDB per upsert (50-250 works well).")
+):
     """
     Generates embeddings for the text chunks in a given JSON file (previously processed from a PDF).
     The JSON file is expected to be in the 'processed_data' directory.
+    With ?background=true the work runs after the response is sent: the endpoint returns
+    202 Accepted with a job_id whose progress can be polled at /jobs/{job_id}.
+    batch_size sets how many chunks go into each ChromaDB write.
     """
     try:
         # URL-decode the filename to handle spaces and other special characters.
@@ -204,9 +489,17 @@ async def generate_embeddings_endpoint(json_file: str):
             logger.warning(f"Embeddings generation attempt for non-existent JSON file: {json_path}")
             raise HTTPException(status_code=404, detail=f"File not found: {decoded_json_file}")
             
+        if background:
+            job_id = uuid.uuid4().hex
+            _write_job_status(job_id, {"job_id": job_id, "json_file": decoded_json_file, "status": "pending"})
+            # Sync tasks run in Starlette's thread pool, so the event loop stays free.
+            background_tasks.add_task(_run_embedding_job, job_id, decoded_json_file, json_path, batch_size)
+            logger.info(f"Queued background embedding job {job_id} for JSON file: {json_path}")
+            return JSONResponse(status_code=202, content={"job_id": job_id, "status": "pending", "status_url": f"/jobs/{job_id}"})
+
         # Generate embeddings using the embedding_pipeline module.
         logger.info(f"Generating embeddings for JSON file: {json_path}")
-        result = process_json_for_embeddings(json_path, collection_name=config.TEXT_EMBEDDINGS_COLLECTION)
+        result = process_json_for_embeddings(json_path, collection_name=config.TEXT_EMBEDDINGS_COLLECTION, batch_size=batch_size)
         
         return EmbeddingResponse(
             success=True,
@@ -214,7 +507,8 @@ async def generate_embeddings_endpoint(json_file: str):
             output_file=result["output_file"],
             num_embeddings=result["num_embeddings"],
             embedding_dimension=result["embedding_dimension"],
-            message=result["message"]
+            message=result["message"],
+            batch_size=batch_size
         )
         
     except HTTPException as http_ex:
@@ -223,6 +517,22 @@ async def generate_embeddings_endpoint(json_file: str):
         logger.error(f"Error generating embeddings for '{json_file}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred while generating embeddings: {type(e).__name__}")
 
+# Endpoint to check on a background embedding job.
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Returns the status ("pending", "running", "completed" or "failed") of a background embedding job,
+    including the embedding result once it has finished.
+    """
+    # Job ids are uuid4 hex strings; anything else can't name a job file.
+    if not (len(job_id) == 32 and all(c in "0123456789abcdef" for c in job_id)):
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    try:
+        with open(_job_status_path(job_id)) as f:
+            return JSONResponse(json.load(f))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
 # Endpoint to upload an image file.
 @app.post("/upload-image", response_model=ImageUploadResponse)
 async def upload_image_endpoint(request: Request, file: UploadFile = File(...)):
@@ -235,25 +545,25 @@ async def upload_image_endpoint(request: Request, file: UploadFile = File(...)):
     if file_extension not in config.ALLOWED_IMAGE_EXTENSIONS:
         logger.warning(f"Image upload attempt with invalid extension: {original_filename} ({file_extension})")
         raise HTTPException(status_code=400, detail=f"Only image files with extensions {config.ALLOWED_IMAGE_EXTENSIONS} are accepted")
+    if not is_image_data(read_upload_head(file)):
+        logger.warning(f"Image upload '{original_filename}' does not contain image data.")
+        raise HTTPException(status_code=415, detail="The uploaded file is not a supported image (PNG, JPEG, GIF, BMP or WebP).")
 
     try:
         # Generate a unique filename to prevent overwrites and ensure security
         unique_filename = f"{uuid.uuid4()}{file_extension}"
         local_file_path = os.path.join(config.UPLOADED_IMAGES_DIR, unique_filename)
         
-        with open(local_file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        await save_upload(file, local_file_path)
         logger.info(f"Image '{original_filename}' uploaded and saved as '{unique_filename}' to '{local_file_path}'")
         
         # Construct the URL path for the browser
         browser_accessible_file_path = f"/{config.UPLOADED_IMAGES_DIR}/{unique_filename}"
 
-        # URL-encode the unique_filename for the next command
-        url_encoded_filename = urllib.parse.quote(unique_filename)
+        # unique_filename is a UUID plus an allowed extension, so it is already URL-safe as is.
         base_url = str(request.base_url).rstrip('/')
         # Update describe_command to use POST with JSON body
-        next_command = f"curl -X POST {base_url}/describe-image/{url_encoded_filename} -H 'Content-Type: application/json' -d '{{\"prompt\": \"Describe this image in detail.\"}}'"
+        next_command = f"curl -X POST {base_url}/describe-image/{unique_filename} -H 'Content-Type: application/json' -d '{{\"prompt\": \"Describe this image in detail.\"}}'"
 
         return ImageUploadResponse(
             success=True,
@@ -304,7 +614,8 @@ async def describe_image_endpoint(
                 similar_images = search_similar(
                     query_embedding=uploaded_image_embedding,
                     collection_name=config.IMAGE_EMBEDDINGS_COLLECTION,
-                    top_k=1
+                    top_k=1,
+                    collection=app.state.collections.get(config.IMAGE_EMBEDDINGS_COLLECTION)
                 )
                 if similar_images and similar_images[0]['similarity'] is not None and similar_images[0]['similarity'] >= config.IMAGE_SIMILARITY_THRESHOLD:
                     matched_symbol = similar_images[0]
@@ -354,38 +665,41 @@ async def search_endpoint(query: SearchQuery, request: Request):
     It generates an embedding for the query, searches for similar text chunks in ChromaDB,
     (now potentially searching both text and symbol collections)
     and then uses the fine-tuned model to generate a concise answer.
+    response_format "json" returns JSON, "stream" streams the answer as server-sent events,
+    and anything else returns plain text.
     """
     try:
         logger.info(f"Received search query: '{query.query}' with top_k={query.top_k}")
-        query_embedding = get_embedding_for_query(query.query)
+        # The embedding call and the Chroma queries block, so they run in the thread pool and the
+        # event loop keeps serving other requests meanwhile.
+        if not query.query.strip():
+            raise HTTPException(status_code=400, detail="Query must not be empty.")
+        try:
+            query_embedding = await run_in_threadpool(get_query_embedding, query.query)
+        except Exception as e:
+            logger.error(f"Could not embed query '{query.query}': {e}", exc_info=True)
+            query_embedding = None
+        # Without an embedding there is nothing to search, so skip the Chroma queries and the model call.
+        if not query_embedding:
+            raise HTTPException(status_code=503, detail="The embedding service is unavailable. Please try again later.")
         
-        # Search in car manuals collection
-        manual_results = search_similar(query_embedding, collection_name=config.TEXT_EMBEDDINGS_COLLECTION, top_k=query.top_k)
+        # Search the car manuals and dashboard symbols collections concurrently.
+        manual_results, symbol_results = await asyncio.gather(
+            run_in_threadpool(search_similar, query_embedding, collection_name=config.TEXT_EMBEDDINGS_COLLECTION, top_k=query.top_k,
+                              collection=app.state.collections.get(config.TEXT_EMBEDDINGS_COLLECTION)),
+            run_in_threadpool(search_similar, query_embedding, collection_name=config.DASHBOARD_SYMBOLS_TEXT_COLLECTION, top_k=query.top_k,
+                              collection=app.state.collections.get(config.DASHBOARD_SYMBOLS_TEXT_COLLECTION)),
+        )
         logger.info(f"Manual results for query '{query.query}': {manual_results}")
-        
-        # Search in dashboard symbols collection
-        symbol_results = search_similar(query_embedding, collection_name=config.DASHBOARD_SYMBOLS_TEXT_COLLECTION, top_k=query.top_k)
         logger.info(f"Symbol results for query '{query.query}': {symbol_results}")
 
-        combined_results_dict = {}
-        for res_list in [manual_results, symbol_results]:
-            for res in res_list:
-                # Use text content as the key for deduplication to avoid showing identical passages.
-                # Ensure 'text' key exists and is a string.
-                text_key = str(res.get('text', '')) # Use str() to handle potential None and ensure string type
-                combined_results_dict[text_key] = res 
-        
-        all_results = sorted(
-            [res for res in combined_results_dict.values() if res.get('similarity') is not None],
-            key=lambda x: x['similarity'], 
-            reverse=True
-        )[:query.top_k]
+        all_results = combine_search_results([manual_results, symbol_results], query.top_k)
         
         output_lines = []
         output_lines.append(f"Query: \"{query.query}\"")
         output_lines.append(f"Found {len(all_results)} combined results from '{config.TEXT_EMBEDDINGS_COLLECTION}' and '{config.DASHBOARD_SYMBOLS_TEXT_COLLECTION}':")
         
-        context = ""
+        context_parts = []
         formatted_results = []
         
         if all_results:
@@ -399,10 +713,13 @@ async def search_endpoint(query: SearchQuery, request: Request):
                 # + Format similarity score separately to handle None case correctly in f-string
                 similarity_str = f"{similarity_score:.4f}" if similarity_score is not None else "N/A" # +
 
-                output_lines.append(f"--- Result {i+1} (Similarity: {similarity_str}, Source: {source_collection}, Doc ID: {source_doc_id}) ---") # Modified
-                output_lines.append(f"  Text: {text_content}")
-                output_lines.append(f"  Metadata: {metadata}")
-                output_lines.append("-" * 20)
+                # One block per result; output_lines is joined with newlines, so this renders as four lines.
+                output_lines.append(
+                    f"--- Result {i+1} (Similarity: {similarity_str}, Source: {source_collection}, Doc ID: {source_doc_id}) ---\n"
+                    f"  Text: {text_content}\n"
+                    f"  Metadata: {metadata}\n"
+                    "--------------------"
+                )
                 
                 formatted_results.append({
                     "text": text_content,
@@ -412,30 +729,42 @@ async def search_endpoint(query: SearchQuery, request: Request):
                     "source_document_id": source_doc_id
                 })
                 
-                context += text_content + "\n\n"
+                context_parts.append(text_content)
         else:
             output_lines.append("No results found.")
             logger.info(f"No results found for query: '{query.query}'")
         
+        context = "\n\n".join(context_parts)
         logger.info(f"Context being sent to LLM for query '{query.query}':\n{context}")
 
-        answer = "No relevant information found to answer your query."
+        # Streaming clients get the answer token by token as server-sent events instead of one response.
+        if query.response_format == "stream":
+            return StreamingResponse(stream_answer(query.query, context), media_type="text/event-stream",
+                                     headers={"Cache-Control": "no-cache"})
+
+        answer = NO_ANSWER_MESSAGE
         error_message_llm = None
         
         if context:
             try:
-                logger.info(f"Sending query to fine-tuned model: {config.FINE_TUNED_MODEL_ID}")
-                response = openai_client.chat.completions.create(
-                    model=config.FINE_TUNED_MODEL_ID, 
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant specializing in car manuals. Based on the provided context, give a comprehensive and detailed answer to the user\'s question. Explain the steps or information clearly."},
-                        {"role": "user", "content": f"Context: {context}\n\nQuestion: {query.query}"}
-                    ],
-                    temperature=0.3,
-                    max_tokens=450
-                )
-                answer = response.choices[0].message.content
-                logger.info(f"Received answer from fine-tuned model for query: '{query.query}'")
+                cache_key = _answer_cache_key(query.query, context, config.FINE_TUNED_MODEL_ID)
+                cached_answer = await _get_cached_answer(cache_key)
+                if cached_answer is not None:
+                    answer = cached_answer
+                    logger.info(f"Using cached answer for query: '{query.query}'")
+                else:
+                    logger.info(f"Sending query to fine-tuned model: {config.FINE_TUNED_MODEL_ID}")
+                    # Awaited on the event loop: other requests are served while the model generates.
+                    response = await async_openai_client.chat.completions.create(
+                        model=config.FINE_TUNED_MODEL_ID, 
+                        messages=_answer_messages(query.query, context),
+                        temperature=0.3,
+                        max_tokens=450
+                    )
+                    answer = response.choices[0].message.content
+                    logger.info(f"Received answer from fine-tuned model for query: '{query.query}'")
+                    if answer:
+                        await _set_cached_answer(cache_key, answer)
                 output_lines.append("\nGenerated Answer:")
                 output_lines.append(answer)
             except Exception as e_llm:
@@ -461,6 +790,52 @@ async def search_endpoint(query: SearchQuery, request: Request):
         logger.error(f"Error during search for query '{query.query}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred during search: {type(e).__name__}")
 
+# Endpoint to run several semantic searches in one request
+@app.post("/search/batch")
+async def batch_search_endpoint(batch: BatchSearchQuery):
+    """
+    Performs a semantic search for each query in the request body and returns the combined
+    results from the manual and symbol collections per query (no generated answers).
+    All queries are embedded with a single embeddings request, and every collection search
+    runs concurrently.
+    """
+    if not batch.queries or any(not q.strip() for q in batch.queries):
+        raise HTTPException(status_code=400, detail="Provide at least one query, and no empty queries.")
+    if len(batch.queries) > config.MAX_BATCH_SEARCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {config.MAX_BATCH_SEARCH_QUERIES} queries are accepted per batch.")
+
+    try:
+        logger.info(f"Received batch search with {len(batch.queries)} queries and top_k={batch.top_k}")
+        # Every query not memoized or in the embedding cache is embedded in one request.
+        query_embeddings = await run_in_threadpool(get_query_embeddings, batch.queries)
+
+        collections = (config.TEXT_EMBEDDINGS_COLLECTION, config.DASHBOARD_SYMBOLS_TEXT_COLLECTION)
+        search_results = await asyncio.gather(*(
+            run_in_threadpool(search_similar, query_embedding, collection_name=collection_name, top_k=batch.top_k,
+                              collection=app.state.collections.get(collection_name))
+            for query_embedding in query_embeddings
+            for collection_name in collections
+        ))
+
+        batch_results = []
+        for i, query_text in enumerate(batch.queries):
+            per_collection = search_results[i * len(collections):(i + 1) * len(collections)]
+            batch_results.append({
+                "query": query_text,
+                "results": [{
+                    "text": result.get('text'),
+                    "similarity": result.get('similarity'),
+                    "metadata": result.get('metadata', {}),
+                    "source_collection": result.get('metadata', {}).get('collection_source', 'unknown_collection'),
+                    "source_document_id": result.get('metadata', {}).get('source_document_id', 'unknown_source_doc')
+                } for result in combine_search_results(per_collection, batch.top_k)]
+            })
+        return JSONResponse({"results": batch_results})
+
+    except Exception as e:
+        logger.error(f"Error during batch search of {len(batch.queries)} queries: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred during batch search: {type(e).__name__}")
+
 # Health check endpoint to verify the server is running.
 @app.get("/health")
 async def health_check():
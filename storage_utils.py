@@ -1,5 +1,5 @@
 # This module provides utility functions for storing processed data, primarily text chunks from documents.
-import json
+import orjson # Fast JSON encoder; writes UTF-8 bytes directly.
 import os
 from typing import List, Dict # For type hinting.
 from datetime import datetime # For generating timestamps.
@@ -21,8 +21,9 @@ def save_chunks_to_json(chunks: List[Dict], source_pdf: str) -> str:
     Returns:
         str: The path to the created JSON file.
     """
-    # Generate a timestamp for the filename to ensure uniqueness.
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # One timestamp serves both the filename (for uniqueness) and the processing_timestamp field.
+    now = datetime.now()
+    timestamp = now.strftime("%Y%m%d_%H%M%S")
     
     # Create a safe base name for the output file from the source PDF path.
     # This extracts the filename without extension from the source_pdf path.
@@ -39,14 +40,14 @@ def save_chunks_to_json(chunks: List[Dict], source_pdf: str) -> str:
     # Prepare the data structure to be saved in the JSON file.
     output_data = {
         "source_pdf": source_pdf, # Path to the original source PDF.
-        "processing_timestamp": datetime.now().isoformat(), # ISO format timestamp of processing.
+        "processing_timestamp": now.isoformat(), # ISO format timestamp of processing.
         "num_chunks": len(chunks), # Total number of chunks processed.
         "chunks": chunks # The list of chunk data.
     }
     
     # Write the data to the JSON file.
-    with open(output_file_path, 'w') as f:
-        json.dump(output_data, f, indent=2) # Use indent for pretty printing.
+    with open(output_file_path, 'wb') as f:
+        f.write(orjson.dumps(output_data, option=orjson.OPT_INDENT_2)) # Use indent for pretty printing.
         
     print(f"Successfully saved {len(chunks)} chunks to {output_file_path}")
     return output_file_path
@@ -0,0 +1,5 @@
+# Lets pytest import the app modules (embeddings, chroma_store, ...) from the repository root.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -1,5 +1,6 @@
 # This script is a simple test to verify that the OpenAI embedding generation is working correctly.
 # It calls the `get_embedding_for_query` function with a test string and prints the result.
+# Run it from the repository root: python -m tests.test_embedding
 
 from embeddings import get_embedding_for_query # The function to test.
 
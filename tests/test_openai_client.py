@@ -1,3 +1,5 @@
+# Checks that the OpenAI client can be created and reach the API.
+# Run it from the repository root: python -m tests.test_openai_client
 import os
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -0,0 +1,264 @@
+# This script provides a command-line interface to test querying the ChromaDB vector store.
+# It allows users to input a query, generates an embedding for it, and retrieves similar documents.
+# Run it from the repository root: python -m tests.test_queries
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+from embeddings import get_embedding_for_query, get_embeddings_for_queries, EMBEDDING_MODEL # Functions to generate query embeddings.
+from chroma_store import search_similar, search_similar_columns, SearchResults, DEFAULT_COLLECTION_NAME # Functions to search ChromaDB for similar documents.
+
+# Maximum number of test queries in flight at once, so a long query list doesn't trip the API rate limit.
+MAX_CONCURRENT_QUERIES = 5
+
+# Display of each search result: long texts are cut to MAX_DISPLAY_CHARS (ellipsis included) for readability.
+MAX_DISPLAY_CHARS = 300
+_ELLIPSIS = "..."
+_TRUNCATE_AT = MAX_DISPLAY_CHARS - len(_ELLIPSIS)
+_RESULT_SEPARATOR = "-" * 30
+
+# Query embeddings are saved here as one .npy file per query, so repeated runs (e.g. in CI)
+# load the demo queries' vectors from disk instead of calling the embeddings API.
+QUERY_EMBEDDING_CACHE_DIR = os.getenv("QUERY_EMBEDDING_CACHE_DIR", ".query_embedding_cache")
+
+def _cache_path(normalized_query: str) -> str:
+    key = hashlib.sha256(f"{EMBEDDING_MODEL}\0{normalized_query}".encode('utf-8')).hexdigest()
+    return os.path.join(QUERY_EMBEDDING_CACHE_DIR, f"{key}.npy")
+
+def _load_cached(normalized_query: str) -> Optional[np.ndarray]:
+    """Returns the saved embedding of a query (memory-mapped, so nothing is copied), or None."""
+    try:
+        return np.load(_cache_path(normalized_query), mmap_mode='r')
+    except (OSError, ValueError): # Not cached yet, or an unreadable file that will be overwritten.
+        return None
+
+def _save_cached(normalized_query: str, embedding: Sequence[float]):
+    os.makedirs(QUERY_EMBEDDING_CACHE_DIR, exist_ok=True)
+    path = _cache_path(normalized_query)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.asarray(embedding, dtype=np.float32))
+    os.replace(tmp_path, path) # Concurrent runs never load a half-written file.
+
+def _load_or_embed(normalized_query: str) -> np.ndarray:
+    """Loads a query's embedding from QUERY_EMBEDDING_CACHE_DIR, embedding and saving it on a miss."""
+    cached = _load_cached(normalized_query)
+    if cached is not None:
+        return cached
+    embedding = get_embedding_for_query(normalized_query, use_cache=True)
+    if not embedding:
+        raise RuntimeError("embedding was empty") # Not cached, so a later call retries.
+    _save_cached(normalized_query, embedding)
+    return np.asarray(embedding, dtype=np.float32)
+
+@lru_cache(maxsize=1024)
+def _cached_embed(normalized_query: str) -> Tuple[float, ...]:
+    """Embeds a normalized query once per run (and across runs, via _load_or_embed)."""
+    return tuple(_load_or_embed(normalized_query).tolist())
+
+def normalize_query(query_text: str) -> str:
+    return " ".join(query_text.lower().split())
+
+def get_test_query_embedding(query_text: str) -> List[float]:
+    """Returns the embedding of a query, memoized on its lower-cased, whitespace-collapsed form."""
+    return list(_cached_embed(normalize_query(query_text)))
+
+def embed_test_queries(queries: List[str]) -> List[np.ndarray]:
+    """Returns the embedding of every query, loading saved ones from disk and embedding the rest in one batch."""
+    normalized = [normalize_query(q) for q in queries]
+    embeddings = [_load_cached(q) for q in normalized]
+    misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if misses:
+        fresh = get_embeddings_for_queries([normalized[i] for i in misses])
+        for i, embedding in zip(misses, fresh):
+            _save_cached(normalized[i], embedding)
+            embeddings[i] = embedding
+    return embeddings
+
+def _write_report(out: io.StringIO):
+    sys.stdout.write(out.getvalue())
+    sys.stdout.flush()
+
+async def run_test_query(query_text: str, top_k: int = 3, semaphore: asyncio.Semaphore = None,
+                         query_embedding: Optional[Sequence[float]] = None, verbose: bool = True) -> Optional[SearchResults]:
+    """
+    Executes a test query against the ChromaDB vector store.
+
+    It performs the following steps:
+    1. Generates an embedding for the `query_text` (memoized, see `get_test_query_embedding`).
+    2. Searches ChromaDB for the `top_k` most similar documents using `search_similar`.
+    3. Prints the query, the number of results found, and details of each result (text, similarity, metadata).
+
+    The blocking embedding and search calls run in worker threads, and the report is printed
+    in one piece at the end, so several queries can run concurrently (see run_test_queries).
+
+    Args:
+        query_text (str): The natural language query to test.
+        top_k (int, optional): The number of top similar results to retrieve. Defaults to 3.
+        semaphore (asyncio.Semaphore, optional): Limits how many queries run at once.
+        query_embedding (Sequence[float], optional): A precomputed embedding (e.g. one returned by
+            embed_test_queries); if given, step 1 is skipped.
+        verbose (bool, optional): If False, step 3 is skipped (errors are still printed), so timing the
+            call measures the search alone. Defaults to True.
+
+    Returns:
+        Optional[SearchResults]: The search results, or None if the embedding or search failed.
+    """
+    # The report is buffered and written to stdout in one go: fewer writes, and concurrent
+    # queries don't interleave their output.
+    out = io.StringIO()
+    results = None
+    print(f"\n--- Testing Query ---", file=out)
+    print(f"Query: \"{query_text}\"", file=out)
+    print(f"Requesting top {top_k} results.", file=out)
+
+    async with semaphore or asyncio.Semaphore(1):
+        # Step 1: Generate embedding for the query.
+        try:
+            if query_embedding is None:
+                print("\nGenerating embedding for the query...", file=out)
+                # A little jitter keeps concurrently started queries from hitting the API in lockstep.
+                await asyncio.sleep(random.uniform(0, 0.05))
+                query_embedding = await asyncio.to_thread(get_test_query_embedding, query_text)
+            if len(query_embedding) == 0:
+                print("Failed to generate query embedding (embedding was empty).", file=out)
+                _write_report(out)
+                return
+            print(f"Successfully generated embedding for the query (dimension: {len(query_embedding)}).", file=out)
+        except Exception as e:
+            print(f"Error generating query embedding: {e}", file=out)
+            _write_report(out)
+            return # Exit if embedding generation fails.
+
+        # Step 2: Search for similar chunks in ChromaDB.
+        try:
+            print("\nSearching for similar documents in ChromaDB...", file=out)
+            # Columnar results: no per-result dicts to build or look up, which matters for large top_k.
+            search_start = time.perf_counter()
+            results = await asyncio.to_thread(search_similar_columns, query_embedding, collection_name=DEFAULT_COLLECTION_NAME, top_k=top_k)
+            search_ms = (time.perf_counter() - search_start) * 1000
+            if not verbose:
+                return results
+            print(f"\n--- Search Results ---", file=out)
+            print(f"Found {len(results)} result(s) for query: \"{query_text}\" in {search_ms:.1f} ms", file=out)
+
+            if len(results):
+                # Results are already ordered from most to least similar.
+                for i, (text, similarity_score, metadata) in enumerate(zip(results.texts, results.similarities, results.metadatas)):
+                    # Ensure text is handled well, especially if it contains newlines or is very long.
+                    text_content = str(text) if text is not None else 'N/A'
+                    # For display, limit length and indent continuation lines. Truncating first means
+                    # long chunks are never scanned or copied in full.
+                    if len(text_content) > MAX_DISPLAY_CHARS: # Truncate long texts for readability.
+                        display_text = text_content[:_TRUNCATE_AT].replace('\n', ' \n  ') + _ELLIPSIS
+                    else:
+                        display_text = text_content.replace('\n', ' \n  ')
+                    # One write per result; the dashes separate results for better readability.
+                    print(f"\n--- Result {i+1} ---\n"
+                          f"  Text: {display_text}\n"
+                          f"  Similarity: {similarity_score:.4f}\n"
+                          f"  Metadata: {metadata or {}}\n"
+                          f"{_RESULT_SEPARATOR}", file=out)
+            else:
+                print("No results found in ChromaDB for this query.", file=out)
+
+        except Exception as e:
+            print(f"Error searching ChromaDB: {e}", file=out)
+
+    _write_report(out)
+    return results
+
+def _warm_collection(dimension: int):
+    """Runs one throwaway query so opening the collection and loading its HNSW index from disk
+    happen before, not during, the first real test query.
+    """
+    try:
+        search_similar([0.0] * dimension, collection_name=DEFAULT_COLLECTION_NAME, top_k=1)
+    except Exception as e:
+        print(f"Could not warm up collection '{DEFAULT_COLLECTION_NAME}': {e}")
+
+async def run_test_queries(queries: List[str], top_k: int = 3):
+    """Embeds all queries (saved embeddings from disk, the rest in one batched call), then runs run_test_query for every query
+    concurrently, at most MAX_CONCURRENT_QUERIES at a time.
+
+    The one-time costs (embedding API connection setup, opening the collection) are timed and reported
+    separately from the queries, so they don't skew the measured search times.
+    """
+    warmup_start = time.perf_counter()
+    try:
+        query_embeddings = await asyncio.to_thread(embed_test_queries, queries)
+    except Exception as e:
+        print(f"Error generating query embeddings: {e}")
+        return
+    if query_embeddings:
+        await asyncio.to_thread(_warm_collection, len(query_embeddings[0]))
+    print(f"Warm-up (query embeddings + collection load): {time.perf_counter() - warmup_start:.2f} s")
+
+    measured_start = time.perf_counter()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+    # Each query gets its own vector (a row or memory-mapped array); search_similar accepts it as is.
+    await asyncio.gather(*(run_test_query(query, top_k, semaphore, query_embedding=embedding)
+                           for query, embedding in zip(queries, query_embeddings)))
+    print(f"\nMeasured: {len(queries)} queries in {time.perf_counter() - measured_start:.2f} s")
+
+async def benchmark_test_queries(queries: List[str], top_k: int = 3, rounds: int = 10):
+    """Runs every query `rounds` times with verbose=False and prints only the overall throughput.
+
+    Embeddings and the collection warm-up are done once beforehand and not counted, so the
+    number reflects search alone (e.g. to compare HNSW settings).
+    """
+    try:
+        query_embeddings = await asyncio.to_thread(embed_test_queries, queries)
+    except Exception as e:
+        print(f"Error generating query embeddings: {e}")
+        return
+    if not query_embeddings:
+        return
+    await asyncio.to_thread(_warm_collection, len(query_embeddings[0]))
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_test_query(query, top_k, semaphore, query_embedding=embedding, verbose=False)
+                                     for _ in range(rounds)
+                                     for query, embedding in zip(queries, query_embeddings)))
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for r in results if r is None)
+    print(f"\nBenchmark: {len(results)} queries (top_k={top_k}) in {elapsed:.2f} s, "
+          f"{len(results) / elapsed:.1f} queries/sec" + (f", {failed} failed" if failed else ""))
+
+# This block executes when the script is run directly.
+if __name__ == "__main__":
+    # --- Configuration for the test queries ---
+    # You can change the sample_queries and number_of_results here to test different scenarios.
+
+    sample_queries = [
+        "How do I change the oil?",
+        "What are the safety features described in the manual?",
+        "Tell me about the infotainment system and its connectivity options.",
+        "What is the recommended tire pressure?",
+    ]
+
+    number_of_results = 3  # Specify how many top results you want to retrieve.
+    benchmark_rounds = int(os.getenv("TEST_QUERY_BENCHMARK_ROUNDS", "0"))  # If > 0, only time this many silent rounds of the queries.
+    # -------------------------------------------
+
+    try:
+        # uvloop comes with uvicorn[standard] on Linux and macOS; it has cheaper socket handling than the default loop.
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass # Not available (e.g. on Windows); the default event loop works just as well, only a little slower.
+
+    print("Starting test query script...")
+    if benchmark_rounds > 0:
+        asyncio.run(benchmark_test_queries(sample_queries, top_k=number_of_results, rounds=benchmark_rounds))
+    else:
+        asyncio.run(run_test_queries(sample_queries, top_k=number_of_results))
+    print("\nTest query script finished.")
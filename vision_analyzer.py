@@ -1,8 +1,6 @@
 import base64
 import requests # For fetching image from URL if needed
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
 import config # +
 import logging # +
 
@@ -20,12 +18,9 @@ logger = logging.getLogger(__name__) # +
 # If running standalone and not via main.py, basicConfig might be needed here too.
 # For now, assume it's part of the larger app context or run after main.py initializes logging.
 
-# Load environment variables, especially OPENAI_API_KEY
-load_dotenv()
-
-# Initialize OpenAI client
-# Ensure OPENAI_API_KEY is set in your .env or system environment
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Reuse the process-wide OpenAI client from embeddings.py (which loads OPENAI_API_KEY from .env)
+# so vision and text requests share one client and its connection pool.
+from embeddings import client
 
 # Specify the GPT-4 Vision model - REMOVED, will use config.VISION_MODEL_ID
 # GPT_4_VISION_MODEL = "gpt-4.1-mini" 